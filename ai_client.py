@@ -0,0 +1,152 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
+import openai
+
+import rate_limit
+from backend.metrics import timed
+from rate_limit import RateLimited, parse_retry_after
+
+
+OPENAI_KEY = os.getenv("OPENAI_KEY")
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+OPENAI_PER_USER = int(os.getenv("OPENAI_PER_USER", "2"))
+OPENAI_BATCH_PER_USER = int(os.getenv("OPENAI_BATCH_PER_USER", "6"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "90"))
+
+# AI_FAKE=1 answers locally after AI_FAKE_DELAY seconds, no network
+AI_FAKE = os.getenv("AI_FAKE") == "1"
+AI_FAKE_DELAY = float(os.getenv("AI_FAKE_DELAY", "1.0"))
+
+CHAT_MODEL = "gpt-4o-mini"
+IMAGE_MODEL = "dall-e-3"
+
+openai.api_key = OPENAI_KEY
+
+
+# ================================
+# CONCURRENCY
+# ================================
+
+_global_slots = asyncio.Semaphore(OPENAI_CONCURRENCY)
+_user_slots = {}
+
+
+@asynccontextmanager
+async def slot(user_id=None, limit=OPENAI_PER_USER):
+    # a single user can hold at most `limit` of the global slots,
+    # so one heavy user can't starve everybody else
+    entry = _user_slots.get(user_id)
+    if entry is None:
+        entry = _user_slots[user_id] = [asyncio.Semaphore(limit), 0]
+    entry[1] += 1
+
+    try:
+        async with entry[0]:
+            async with _global_slots:
+                yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _user_slots.pop(user_id, None)
+
+
+# ================================
+# RATE LIMITS
+# ================================
+
+async def limited(make_call):
+    async def call():
+        try:
+            return await make_call()
+        except openai.error.RateLimitError as e:
+            raise RateLimited(parse_retry_after((e.headers or {}).get("retry-after")))
+
+    return await rate_limit.run("openai", OPENAI_KEY, call)
+
+
+# ================================
+# FAKE PROVIDER
+# ================================
+
+async def _fake_chat(messages):
+    await asyncio.sleep(AI_FAKE_DELAY)
+    prompt = messages[-1]["content"]
+    return {"choices": [{"message": {"content": f"[fake] {prompt.strip()[-200:]}"}}]}
+
+async def _fake_stream(messages):
+    r = await _fake_chat(messages)
+    for word in r["choices"][0]["message"]["content"].split(" "):
+        await asyncio.sleep(AI_FAKE_DELAY / 20)
+        yield {"choices": [{"delta": {"content": word + " "}}]}
+
+async def _fake_image(prompt):
+    await asyncio.sleep(AI_FAKE_DELAY)
+    return {"data": [{"url": "https://placehold.co/1024x1792.png"}]}
+
+
+# ================================
+# API
+# ================================
+
+async def chat(prompt, user_id=None, max_tokens=900, limit=OPENAI_PER_USER):
+    messages = [{"role": "user", "content": prompt}]
+
+    async with slot(user_id, limit):
+        if AI_FAKE:
+            call = _fake_chat(messages)
+        else:
+            call = limited(lambda: openai.ChatCompletion.acreate(
+                model=CHAT_MODEL,
+                messages=messages,
+                max_tokens=max_tokens
+            ))
+        with timed("openai_chat"):
+            r = await asyncio.wait_for(call, OPENAI_TIMEOUT)
+
+    return r["choices"][0]["message"]["content"]
+
+async def stream_chat(prompt, user_id=None, max_tokens=900):
+    messages = [{"role": "user", "content": prompt}]
+
+    async with slot(user_id):
+        if AI_FAKE:
+            chunks = _fake_stream(messages)
+        else:
+            # time until the stream opens; the rest is bounded by max_tokens
+            with timed("openai_stream_open"):
+                chunks = await asyncio.wait_for(
+                    limited(lambda: openai.ChatCompletion.acreate(
+                        model=CHAT_MODEL,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        stream=True
+                    )),
+                    OPENAI_TIMEOUT
+                )
+
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), OPENAI_TIMEOUT)
+            except StopAsyncIteration:
+                break
+
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                yield content
+
+async def image(prompt, user_id=None, size="1024x1792"):
+    async with slot(user_id):
+        if AI_FAKE:
+            call = _fake_image(prompt)
+        else:
+            call = limited(lambda: openai.Image.acreate(
+                model=IMAGE_MODEL,
+                prompt=prompt,
+                size=size
+            ))
+        with timed("openai_image"):
+            r = await asyncio.wait_for(call, OPENAI_TIMEOUT)
+
+    return r["data"][0]["url"]
@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+from collections import namedtuple
+
+from fastapi import Request
+from sqlalchemy import select, func
+
+from database import AsyncSessionLocal
+from models import User, UserInvalidation
+from metrics import timed
+
+# the logged-in user is resolved without touching the database: the signed
+# session cookie only holds the user id; email and token stay in a
+# short-lived per-process cache, dropped when an admin changes the user and
+# re-read after AUTH_CACHE_TTL seconds at most.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_POLL = float(os.getenv("AUTH_CACHE_POLL", "2"))
+
+# plain values instead of ORM rows, so a cached user is never tied to a session
+Principal = namedtuple("Principal", "id email api_token")
+
+# user_id -> (expires, principal)
+_cache = {}
+
+_last_event = None
+
+# -----------------------
+# CACHE
+# -----------------------
+
+def remember(request: Request, user):
+    principal = Principal(user.id, user.email, user.api_token)
+    request.session["user_id"] = user.id
+    _cache[user.id] = (time.monotonic() + AUTH_CACHE_TTL, principal)
+    return principal
+
+def forget(user_id):
+    _cache.pop(user_id, None)
+
+def sweep():
+    now = time.monotonic()
+    for user_id, (expires, _) in list(_cache.items()):
+        if expires < now:
+            _cache.pop(user_id, None)
+
+# -----------------------
+# DEPENDENCY
+# -----------------------
+
+async def get_current_user(request: Request):
+    user_id = request.session.get("user_id")
+
+    if not user_id:
+        return None
+
+    entry = _cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    with timed("db_current_user"):
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
+
+    if not user:
+        request.session.clear()
+        return None
+
+    return remember(request, user)
+
+# -----------------------
+# CROSS-PROCESS INVALIDATION
+# -----------------------
+
+# admin actions write a user_invalidations row (the bot reads the same
+# table); other web workers pick it up here
+
+async def _poll():
+    global _last_event
+
+    async with AsyncSessionLocal() as db:
+        if _last_event is None:
+            _last_event = await db.scalar(
+                select(func.max(UserInvalidation.id))
+            ) or 0
+            return []
+
+        events = (await db.scalars(
+            select(UserInvalidation)
+            .where(UserInvalidation.id > _last_event)
+            .order_by(UserInvalidation.id)
+        )).all()
+
+    if events:
+        _last_event = events[-1].id
+
+    return [e.user_id for e in events]
+
+async def watch_invalidations():
+    while True:
+        for user_id in await _poll():
+            forget(user_id)
+        sweep()
+        await asyncio.sleep(AUTH_CACHE_POLL)
@@ -1,82 +1,136 @@
-from models import AdminLog
+from models import AdminLog, UserInvalidation
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_LOGS_PAGE_SIZE = int(os.getenv("ADMIN_LOGS_PAGE_SIZE", "200"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+
+# the session cookie decides who is logged in (and who is admin),
+# so it must not be signed with a guessable default
+if not SESSION_SECRET:
+    raise RuntimeError("SESSION_SECRET is not set")
 
 
 from starlette.middleware.sessions import SessionMiddleware
-from fastapi import FastAPI, Request, Form
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, Request, Form, Depends
+from fastapi.responses import RedirectResponse, PlainTextResponse, StreamingResponse
 
-from database import engine, Base, SessionLocal
+from database import engine, Base, AsyncSessionLocal
 from models import User
-
-from passlib.context import CryptContext
+from migrations import migrate
+import metrics
+from passwords import hash_password_async, verify_password_async
+import passwords
+import auth
+from auth import Principal, get_current_user
+from page_cache import make_templates, cached_page, HashedStaticFiles
+
+from contextlib import asynccontextmanager
+import asyncio
 import secrets
-from sqlalchemy.orm import Session
+import time
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import select, func, text, or_, and_
 
 # -----------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    watcher = asyncio.create_task(auth.watch_invalidations())
+    yield
+    watcher.cancel()
+    passwords.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     SessionMiddleware,
-    secret_key="super-secret-key"
+    secret_key=SESSION_SECRET
 )
 
 Base.metadata.create_all(bind=engine)
+migrate()
 
-templates = Jinja2Templates(directory="../frontend/templates")
-app.mount("/static", StaticFiles(directory="../frontend/static"), name="static")
-
-pwd_context = CryptContext(
-    schemes=["pbkdf2_sha256"],
-    deprecated="auto"
+REQUEST_SECONDS = metrics.Histogram(
+    "smm_http_request_duration_seconds",
+    "Web request latency by route"
 )
 
+@app.middleware("http")
+async def measure_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=str(response.status_code)
+    )
+    return response
+
+templates = make_templates("../frontend/templates", "../frontend/static")
+app.mount("/static", HashedStaticFiles(directory="../frontend/static"), name="static")
+
 # -----------------------
-# PASSWORDS
+# ADMIN LOGGING
 # -----------------------
 
-def hash_password(password: str):
-    return pwd_context.hash(password[:72])
+# added to the caller's session, so the log row is committed
+# in the same transaction as the change it describes
 
-def verify_password(password: str, hashed: str):
-    return pwd_context.verify(password, hashed)
+def log_admin_action(db, admin_email, action, target_email):
+    log = AdminLog(
+        admin_email=admin_email,
+        action=action,
+        target_email=target_email
+    )
+    db.add(log)
 
 # -----------------------
-# CURRENT USER
+# EMAIL SEARCH
 # -----------------------
 
-def get_current_user(request: Request):
-    user_id = request.session.get("user_id")
+def search_emails(query, q):
+    # the trigram index needs at least 3 characters; shorter
+    # searches (and PostgreSQL, which indexes LIKE via pg_trgm) use LIKE
+    if engine.dialect.name != "sqlite" or len(q) < 3:
+        return query.where(User.email.contains(q))
 
-    if not user_id:
-        return None
+    match = text("SELECT rowid FROM users_fts WHERE users_fts MATCH :q").bindparams(
+        q='"' + q.replace('"', '""') + '"'
+    )
+    return query.where(User.id.in_(match))
 
-    db = SessionLocal()
-    user = db.query(User).filter(User.id == user_id).first()
-    db.close()
+def filter_users(query, q, tg):
+    if q:
+        query = search_emails(query, q)
+
+    if tg == "yes":
+        query = query.where(User.tg_id != None)
+
+    if tg == "no":
+        query = query.where(User.tg_id == None)
+
+    return query
 
-    return user
 # -----------------------
-# ADMIN LOGGING
+# BOT USER CACHE
 # -----------------------
 
-def log_admin_action(admin_email, action, target_email):
-    db = SessionLocal()
-    log = AdminLog(
-        admin_email=admin_email,
-        action=action,
-        target_email=target_email
-    )
-    db.add(log)
-    db.commit()
-    db.close()
+# the bot and the other web workers cache users and poll this table
+# to drop users changed here (the bot purges rows older than a day)
+
+def invalidate_user_cache(db, user_id):
+    db.add(UserInvalidation(user_id=user_id))
 
 # -----------------------
 # PAGES
@@ -84,40 +138,32 @@ def log_admin_action(admin_email, action, target_email):
 
 @app.get("/")
 def home(request: Request):
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request}
-    )
+    return cached_page(templates, request, "index.html")
 
 # -----------------------
 
 @app.get("/register")
 def register_page(request: Request):
-    return templates.TemplateResponse(
-        "register.html",
-        {"request": request}
-    )
+    return cached_page(templates, request, "register.html")
 
 @app.post("/register")
-def register_user(
+async def register_user(
     request: Request,
     email: str = Form(...),
     password: str = Form(...)
 ):
-    db: Session = SessionLocal()
-
-    hashed = hash_password(password)
+    hashed = await hash_password_async(password)
     token = secrets.token_hex(16)
 
-    user = User(
-        email=email,
-        password=hashed,
-        api_token=token
-    )
+    async with AsyncSessionLocal() as db:
+        user = User(
+            email=email,
+            password=hashed,
+            api_token=token
+        )
 
-    db.add(user)
-    db.commit()
-    db.close()
+        db.add(user)
+        await db.commit()
 
     return templates.TemplateResponse(
         "register.html",
@@ -131,22 +177,28 @@ def register_user(
 
 @app.get("/login")
 def login_page(request: Request):
-    return templates.TemplateResponse(
-        "login.html",
-        {"request": request}
-    )
+    return cached_page(templates, request, "login.html")
 
 @app.post("/login")
-def login_user(
+async def login_user(
     request: Request,
     email: str = Form(...),
     password: str = Form(...)
 ):
-    db: Session = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.email == email))
 
-    if not user or not verify_password(password, user.password):
-        db.close()
+        if user:
+            valid, new_hash = await verify_password_async(password, user.password)
+        else:
+            valid, new_hash = False, None
+
+        # hashed with old parameters: upgrade while we have the password
+        if valid and new_hash:
+            user.password = new_hash
+            await db.commit()
+
+    if not valid:
         return templates.TemplateResponse(
             "login.html",
             {
@@ -155,8 +207,7 @@ def login_user(
             }
         )
 
-    request.session["user_id"] = user.id
-    db.close()
+    auth.remember(request, user)
 
     # 👉 ЕСЛИ АДМИН
     if user.email == ADMIN_EMAIL:
@@ -170,8 +221,7 @@ def login_user(
 # -----------------------
 
 @app.get("/dashboard")
-def dashboard(request: Request):
-    user = get_current_user(request)
+async def dashboard(request: Request, user: Principal = Depends(get_current_user)):
 
     if not user:
         return RedirectResponse("/login", status_code=302)
@@ -195,8 +245,7 @@ def logout(request: Request):
     return RedirectResponse("/login", status_code=302)
 
 @app.get("/profile")
-def profile_redirect(request: Request):
-    user = get_current_user(request)
+async def profile_redirect(user: Principal = Depends(get_current_user)):
 
     if user:
         return RedirectResponse("/dashboard", status_code=302)
@@ -208,37 +257,48 @@ def profile_redirect(request: Request):
 # -----------------------
 
 @app.get("/admin")
-def admin_panel(
+async def admin_panel(
     request: Request,
     q: str = "",
-    tg: str = ""
+    tg: str = "",
+    after: int = 0,
+    before: int = 0,
+    user: Principal = Depends(get_current_user)
 ):
-    user = get_current_user(request)
-
     if not user or user.email != ADMIN_EMAIL:
         return RedirectResponse("/login", status_code=302)
 
-    db = SessionLocal()
-
-    # ---- STATISTICS ----
-    total_users = db.query(User).count()
-    with_tg = db.query(User).filter(User.tg_id != None).count()
-    without_tg = db.query(User).filter(User.tg_id == None).count()
-
-    # ---- USERS LIST ----
-    query = db.query(User)
-
-    if q:
-        query = query.filter(User.email.contains(q))
-
-    if tg == "yes":
-        query = query.filter(User.tg_id != None)
-
-    if tg == "no":
-        query = query.filter(User.tg_id == None)
-
-    users = query.all()
-    db.close()
+    async with AsyncSessionLocal() as db:
+
+        # ---- STATISTICS ----
+        total_users, with_tg = (await db.execute(select(
+            func.count(User.id),
+            func.count(User.tg_id)
+        ))).one()
+        without_tg = total_users - with_tg
+
+        # ---- USERS LIST ----
+        query = filter_users(select(User), q, tg)
+
+        # keyset pagination on User.id: one page is read regardless of table size
+        if before:
+            users = (await db.scalars(
+                query.where(User.id < before)
+                .order_by(User.id.desc())
+                .limit(ADMIN_PAGE_SIZE + 1)
+            )).all()
+            has_more = len(users) > ADMIN_PAGE_SIZE
+            users = users[:ADMIN_PAGE_SIZE][::-1]
+            has_prev, has_next = has_more, True
+        else:
+            users = (await db.scalars(
+                query.where(User.id > after)
+                .order_by(User.id)
+                .limit(ADMIN_PAGE_SIZE + 1)
+            )).all()
+            has_more = len(users) > ADMIN_PAGE_SIZE
+            users = users[:ADMIN_PAGE_SIZE]
+            has_prev, has_next = after > 0, has_more
 
     return templates.TemplateResponse(
         "admin.html",
@@ -249,7 +309,9 @@ def admin_panel(
             "tg": tg,
             "total_users": total_users,
             "with_tg": with_tg,
-            "without_tg": without_tg
+            "without_tg": without_tg,
+            "prev_before": users[0].id if users and has_prev else None,
+            "next_after": users[-1].id if users and has_next else None
         }
     )
 
@@ -258,69 +320,185 @@ def admin_panel(
 # -----------------------
 
 @app.post("/admin/unlink/{user_id}")
-def admin_unlink(user_id: int, request: Request):
-    user = get_current_user(request)
+async def admin_unlink(user_id: int, user: Principal = Depends(get_current_user)):
     if not user or user.email != ADMIN_EMAIL:
         return RedirectResponse("/login", status_code=302)
 
-    db = SessionLocal()
-    target = db.query(User).filter(User.id == user_id).first()
-    if target:
-        target.tg_id = None
-        db.commit()
-        log_admin_action(user.email, "Unlink Telegram", target.email)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        target = await db.get(User, user_id)
+        if target:
+            target.tg_id = None
+            invalidate_user_cache(db, target.id)
+            log_admin_action(db, user.email, "Unlink Telegram", target.email)
+            await db.commit()
+            auth.forget(target.id)
 
     return RedirectResponse("/admin", status_code=302)
 
 
 @app.post("/admin/reset-token/{user_id}")
-def admin_reset_token(user_id: int, request: Request):
-    user = get_current_user(request)
+async def admin_reset_token(user_id: int, user: Principal = Depends(get_current_user)):
     if not user or user.email != ADMIN_EMAIL:
         return RedirectResponse("/login", status_code=302)
 
-    db = SessionLocal()
-    target = db.query(User).filter(User.id == user_id).first()
-    if target:
-        target.api_token = secrets.token_hex(16)
-        db.commit()
-        log_admin_action(user.email, "Reset token", target.email)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        target = await db.get(User, user_id)
+        if target:
+            target.api_token = secrets.token_hex(16)
+            invalidate_user_cache(db, target.id)
+            log_admin_action(db, user.email, "Reset token", target.email)
+            await db.commit()
+            auth.forget(target.id)
 
     return RedirectResponse("/admin", status_code=302)
 
 @app.post("/admin/delete/{user_id}")
-def admin_delete_user(user_id: int, request: Request):
-    user = get_current_user(request)
+async def admin_delete_user(user_id: int, user: Principal = Depends(get_current_user)):
     if not user or user.email != ADMIN_EMAIL:
         return RedirectResponse("/login", status_code=302)
 
-    db = SessionLocal()
-    target = db.query(User).filter(User.id == user_id).first()
-    if target:
-        log_admin_action(user.email, "Delete user", target.email)
-        db.delete(target)
-        db.commit()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        target = await db.get(User, user_id)
+        if target:
+            log_admin_action(db, user.email, "Delete user", target.email)
+            invalidate_user_cache(db, target.id)
+            await db.delete(target)
+            await db.commit()
+            auth.forget(target.id)
 
     return RedirectResponse("/admin", status_code=302)
 
 @app.get("/admin/logs")
-def admin_logs(request: Request):
-    user = get_current_user(request)
-
+async def admin_logs(
+    request: Request,
+    before: str = "",
+    before_id: int = 0,
+    user: Principal = Depends(get_current_user)
+):
     if not user or user.email != ADMIN_EMAIL:
         return RedirectResponse("/login", status_code=302)
 
-    db = SessionLocal()
-    logs = db.query(AdminLog).order_by(AdminLog.timestamp.desc()).limit(200).all()
-    db.close()
+    # cursor pagination on (timestamp, id), newest first
+    query = select(AdminLog).order_by(AdminLog.timestamp.desc(), AdminLog.id.desc())
+
+    # a malformed cursor is ignored and the newest page is shown
+    try:
+        ts = datetime.fromisoformat(before) if before else None
+    except ValueError:
+        ts = None
+
+    if ts:
+        query = query.where(or_(
+            AdminLog.timestamp < ts,
+            and_(AdminLog.timestamp == ts, AdminLog.id < before_id)
+        ))
+
+    async with AsyncSessionLocal() as db:
+        logs = (await db.scalars(query.limit(ADMIN_LOGS_PAGE_SIZE + 1))).all()
+
+    has_more = len(logs) > ADMIN_LOGS_PAGE_SIZE
+    logs = logs[:ADMIN_LOGS_PAGE_SIZE]
 
     return templates.TemplateResponse(
         "admin_logs.html",
         {
             "request": request,
-            "logs": logs
+            "logs": logs,
+            "next_before": logs[-1] if has_more else None
         }
     )
+
+# -----------------------
+# EXPORT
+# -----------------------
+
+# rows are read through a server-side cursor, EXPORT_CHUNK_SIZE at a time,
+# and each chunk is sent as soon as it is encoded: memory stays flat and
+# the event loop is free between chunks, whatever the table size
+
+USER_EXPORT_COLUMNS = [User.id, User.email, User.api_token, User.tg_id]
+LOG_EXPORT_COLUMNS = [AdminLog.id, AdminLog.timestamp, AdminLog.admin_email, AdminLog.action, AdminLog.target_email]
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json"
+}
+
+def encode_csv(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
+
+def encode_json(fields, rows, first):
+    items = []
+    for row in rows:
+        item = {
+            field: value.isoformat() if isinstance(value, datetime) else value
+            for field, value in zip(fields, row)
+        }
+        items.append(json.dumps(item, ensure_ascii=False))
+
+    return ("[" if first else ",") + ",".join(items)
+
+async def export_rows(query, fmt):
+    fields = [c["name"] for c in query.column_descriptions]
+
+    if fmt == "csv":
+        yield encode_csv([fields])
+
+    first = True
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+
+        async for rows in result.partitions():
+            if fmt == "csv":
+                yield encode_csv(rows)
+            else:
+                yield encode_json(fields, rows, first)
+            first = False
+
+    if fmt == "json":
+        yield "[]" if first else "]"
+
+def export_response(query, fmt, name):
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return StreamingResponse(
+        export_rows(query, fmt),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/admin/export/users.{fmt}")
+async def export_users(
+    fmt: str,
+    q: str = "",
+    tg: str = "",
+    user: Principal = Depends(get_current_user)
+):
+    if not user or user.email != ADMIN_EMAIL:
+        return RedirectResponse("/login", status_code=302)
+
+    if fmt not in EXPORT_MEDIA_TYPES:
+        return PlainTextResponse("Unknown export format", status_code=404)
+
+    query = filter_users(select(*USER_EXPORT_COLUMNS), q, tg).order_by(User.id)
+    return export_response(query, fmt, "users")
+
+@app.get("/admin/export/logs.{fmt}")
+async def export_logs(fmt: str, user: Principal = Depends(get_current_user)):
+    if not user or user.email != ADMIN_EMAIL:
+        return RedirectResponse("/login", status_code=302)
+
+    if fmt not in EXPORT_MEDIA_TYPES:
+        return PlainTextResponse("Unknown export format", status_code=404)
+
+    query = select(*LOG_EXPORT_COLUMNS).order_by(AdminLog.timestamp, AdminLog.id)
+    return export_response(query, fmt, "admin-logs")
+
+# -----------------------
+# METRICS
+# -----------------------
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render())
@@ -0,0 +1,108 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# -----------------------
+# METRICS
+# -----------------------
+
+# minimal Prometheus-style registry shared by the bot and the web app;
+# render() returns the text exposition format served on /metrics
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_registry = []
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', str(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {series[-1]}")
+        return lines
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+def render():
+    with _lock:
+        lines = [line for metric in _registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------
+# STAGES
+# -----------------------
+
+STAGE_SECONDS = Histogram(
+    "smm_stage_duration_seconds",
+    "Latency of hot-path stages (AI, image hosting, publishing, DB lookups)"
+)
+STAGE_TOTAL = Counter(
+    "smm_stage_total",
+    "Hot-path stage calls by outcome"
+)
+
+
+@contextmanager
+def timed(stage, platform=""):
+    # usable in sync and async code alike: `with timed("image_upload"):`
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, platform=platform)
+        STAGE_TOTAL.inc(stage=stage, platform=platform, outcome=outcome)
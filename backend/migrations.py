@@ -0,0 +1,97 @@
+from sqlalchemy import text
+
+from database import engine
+
+# -----------------------
+# MIGRATIONS
+# -----------------------
+
+# each migration runs once, in order, inside its own transaction;
+# applied versions are recorded in schema_version
+
+
+def unique_user_lookups(conn):
+    # a telegram account could be linked to several users before;
+    # keep it on the oldest one, which is what lookups returned
+    conn.execute(text("""
+        UPDATE users SET tg_id = NULL
+        WHERE tg_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM users WHERE tg_id IS NOT NULL GROUP BY tg_id
+        )
+    """))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_api_token ON users (api_token)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_tg_id ON users (tg_id)"
+    ))
+
+
+def email_search_index(conn):
+    # substring search on emails without a table scan: a trigram FTS5
+    # index on SQLite (kept in sync by triggers), pg_trgm on PostgreSQL
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)"
+        ))
+        return
+
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            email, content='users', content_rowid='id', tokenize='trigram'
+        )
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, email) VALUES (new.id, new.email);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, email) VALUES ('delete', old.id, old.email);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF email ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, email) VALUES ('delete', old.id, old.email);
+            INSERT INTO users_fts (rowid, email) VALUES (new.id, new.email);
+        END
+    """))
+    conn.execute(text("INSERT INTO users_fts (users_fts) VALUES ('rebuild')"))
+
+
+def admin_logs_timestamp_index(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_admin_logs_timestamp ON admin_logs (timestamp)"
+    ))
+
+
+MIGRATIONS = [
+    (1, unique_user_lookups),
+    (2, email_search_index),
+    (3, admin_logs_timestamp_index),
+]
+
+
+def migrate():
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+    for version, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version) VALUES (:v)"),
+                {"v": version}
+            )
+
+
+if __name__ == "__main__":
+    migrate()
@@ -7,8 +7,8 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, index=True)
     password = Column(String)
-    api_token = Column(String)
-    tg_id = Column(Integer, nullable=True)
+    api_token = Column(String, unique=True, index=True)
+    tg_id = Column(Integer, nullable=True, unique=True, index=True)
 
 from sqlalchemy import Column, Integer, String, DateTime
 from datetime import datetime
@@ -20,4 +20,11 @@ class AdminLog(Base):
     admin_email = Column(String)
     action = Column(String)
     target_email = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+
+class UserInvalidation(Base):
+    __tablename__ = "user_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
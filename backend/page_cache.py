@@ -0,0 +1,118 @@
+import os
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+import jinja2
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+
+# templates are compiled once per process and their bytecode is kept on disk
+# across restarts; set TEMPLATE_AUTO_RELOAD=1 while editing them
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD") == "1"
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or None
+PAGE_MAX_AGE = int(os.getenv("PAGE_MAX_AGE", "300"))
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+# name -> (body, etag, last_modified)
+_pages = {}
+
+# static path -> (mtime, short content hash)
+_hashes = {}
+
+# -----------------------
+# TEMPLATES
+# -----------------------
+
+def make_templates(directory, static_dir):
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(directory),
+        autoescape=True,
+        auto_reload=TEMPLATE_AUTO_RELOAD,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    )
+    env.globals["static_url"] = lambda path: static_url(static_dir, path)
+
+    return Jinja2Templates(env=env)
+
+# -----------------------
+# PUBLIC PAGES
+# -----------------------
+
+# pages that look the same for every visitor are rendered once and then
+# answered from memory, or with 304 when the browser already has them
+
+def _render(templates, name):
+    body = templates.get_template(name).render().encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+    directory = templates.env.loader.searchpath[0]
+    mtime = max(
+        os.path.getmtime(os.path.join(directory, f))
+        for f in os.listdir(directory)
+    )
+    return body, etag, formatdate(mtime, usegmt=True)
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+def cached_page(templates, request: Request, name):
+    entry = _pages.get(name)
+    if entry is None or TEMPLATE_AUTO_RELOAD:
+        entry = _pages[name] = _render(templates, name)
+
+    body, etag, last_modified = entry
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": f"public, max-age={PAGE_MAX_AGE}"
+    }
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    return HTMLResponse(body, headers=headers)
+
+# -----------------------
+# STATIC FILES
+# -----------------------
+
+# templates link assets as /static/style.css?v=<content hash>; a changed file
+# gets a new URL, so those responses can be cached for a year
+
+def static_url(static_dir, path):
+    entry = _hashes.get(path)
+    if entry is not None and not TEMPLATE_AUTO_RELOAD:
+        return f"/static/{path}?v={entry[1]}"
+
+    full_path = os.path.join(static_dir, path)
+    mtime = os.path.getmtime(full_path)
+
+    if entry is None or entry[0] != mtime:
+        with open(full_path, "rb") as f:
+            entry = _hashes[path] = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+
+    return f"/static/{path}?v={entry[1]}"
+
+class HashedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+
+        if b"v=" in scope.get("query_string", b""):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+
+        return response
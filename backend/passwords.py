@@ -0,0 +1,64 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# pbkdf2 is CPU-bound; it runs in a process pool so hashing neither blocks
+# the event loop nor serializes on the GIL. Hashes made with other rounds
+# are upgraded on the next successful login.
+PASSWORD_ROUNDS = int(os.getenv("PASSWORD_ROUNDS", "29000"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__rounds=PASSWORD_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_ROUNDS
+)
+
+# -----------------------
+# HASHING
+# -----------------------
+
+def hash_password(password: str):
+    return pwd_context.hash(password[:72])
+
+def verify_password(password: str, hashed: str):
+    # returns (valid, new_hash); new_hash is set when the stored hash
+    # was made with different parameters and should be replaced
+    return pwd_context.verify_and_update(password[:72], hashed)
+
+# -----------------------
+# PROCESS POOL
+# -----------------------
+
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # forked children of a threaded process can inherit held locks
+        # (aiosqlite, to_thread workers) and hang; start them from a
+        # clean forkserver process instead
+        _pool = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _pool
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+async def hash_password_async(password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), hash_password, password)
+
+async def verify_password_async(password: str, hashed: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), verify_password, password, hashed)
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib
+
+# drives whole PostState conversations (topic -> generated image -> language
+# -> streamed preview -> publish everywhere) through the aiogram Dispatcher,
+# with OpenAI, ImgBB, the Graph API and Telegram replaced by local stand-ins:
+#
+#   python bench/flow.py --conversations 50 --openai-latency 1.0
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import MockServers
+from report import report
+
+
+BENCH_ENV = {
+    "BOT_TOKEN": "123456:bench",
+    "CHANNEL": "@bench",
+    "META_TOKEN": "bench",
+    "IMGBB_API_KEY": "bench",
+    "OPENAI_KEY": "bench",
+    "FB_PAGE_ID": "1",
+    "IG_USER_ID": "2",
+    "METRICS_PORT": "0",
+    "PUBLISH_POLL": "0.05",
+    "PUBLISH_RATE": "1000",
+    "PUBLISH_WORKERS": "16",
+    "RATE_LIMIT_TELEGRAM": "1000:1000",
+    "RATE_LIMIT_GRAPH": "1000:1000",
+    "RATE_LIMIT_IMGBB": "1000:1000",
+    "RATE_LIMIT_OPENAI": "1000:1000"
+}
+
+STEPS = [
+    ("message", "/menu"),
+    ("message", "topic {i}"),
+    ("callback", "gen"),
+    ("message", "picture {i}"),
+    ("callback", "ru"),
+    ("callback", "publish"),
+    ("callback", "all"),
+    ("callback", "now")
+]
+
+
+class Conversations:
+    def __init__(self, bot_module):
+        self.bot = bot_module.bot
+        self.dp = bot_module.dp
+        self.types = bot_module.types
+        self.update_id = 0
+
+    def update(self, user_id, kind, value):
+        self.update_id += 1
+        chat = {"id": user_id, "type": "private"}
+        user = {"id": user_id, "is_bot": False, "first_name": "bench"}
+        message = {"message_id": self.update_id, "date": int(time.time()), "chat": chat, "from": user}
+
+        if kind == "message":
+            payload = {"message": {**message, "text": value}}
+        else:
+            payload = {"callback_query": {
+                "id": str(self.update_id),
+                "from": user,
+                "chat_instance": "bench",
+                "data": value,
+                "message": {**message, "text": "bench"}
+            }}
+
+        return self.types.Update.model_validate(
+            {"update_id": self.update_id, **payload},
+            context={"bot": self.bot}
+        )
+
+    async def run(self, i, user_id, step_timings):
+        start = time.perf_counter()
+
+        for (kind, value), timings in zip(STEPS, step_timings):
+            step_start = time.perf_counter()
+            await self.dp.feed_update(self.bot, self.update(user_id, kind, value.format(i=i)))
+            timings.append(time.perf_counter() - step_start)
+
+        return time.perf_counter() - start
+
+
+async def wait_published(SessionLocal, PublishJob):
+    while True:
+        db = SessionLocal()
+        left = db.query(PublishJob).filter(PublishJob.status.in_(["pending", "running"])).count()
+        db.close()
+        if not left:
+            return
+        await asyncio.sleep(0.05)
+
+
+async def main(args):
+    mocks = MockServers({
+        "openai": args.openai_latency,
+        "imgbb": args.imgbb_latency,
+        "graph": args.graph_latency,
+        "telegram": args.telegram_latency
+    })
+    await mocks.start()
+
+    os.environ.update(BENCH_ENV)
+    os.environ.update(mocks.env())
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+    database = importlib.import_module("database")
+    models = importlib.import_module("models")
+    database.Base.metadata.create_all(bind=database.engine)
+
+    bot_module = importlib.import_module("bot")
+    publisher = importlib.import_module("publisher")
+    http_client = importlib.import_module("http_client")
+
+    user_ids = [1000 + i for i in range(args.conversations)]
+    db = database.SessionLocal()
+    for user_id in user_ids:
+        db.add(models.User(email=f"{user_id}@bench", password="-", api_token=f"bench-{user_id}", tg_id=user_id))
+    db.commit()
+    db.close()
+
+    workers = publisher.start(bot_module.PUBLISHERS, bot_module.notify_published)
+    conversations = Conversations(bot_module)
+    step_timings = [[] for _ in STEPS]
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one(i, user_id):
+        async with sem:
+            return await conversations.run(i, user_id, step_timings)
+
+    start = time.perf_counter()
+    totals = await asyncio.gather(*(one(i, u) for i, u in enumerate(user_ids)))
+    handled = time.perf_counter() - start
+
+    await wait_published(database.SessionLocal, models.PublishJob)
+    published = time.perf_counter() - start
+
+    print(f"conversations: {args.conversations} (concurrency {args.concurrency})")
+    print(f"mock latency:  {mocks.latency}")
+    print()
+    for (kind, value), timings in zip(STEPS, step_timings):
+        report(f"{kind} {value.format(i='')}".strip(), timings)
+    print()
+    report("conversation", totals, handled, unit="conversations")
+    print(f"{'all posts published':<24} {published:.2f} s")
+    print(f"upstream calls: {mocks.calls}")
+
+    # let the last "published" notifications go out before shutting down
+    await asyncio.sleep(1)
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await http_client.close_session()
+    await bot_module.bot.session.close()
+    await mocks.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--imgbb-latency", type=float, default=0.3)
+    parser.add_argument("--graph-latency", type=float, default=0.3)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
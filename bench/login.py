@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# logins per second through the real /login route, against a throwaway
+# SQLite database:  python bench/login.py --logins 200 --concurrency 20
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "..", "backend")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("SESSION_SECRET", "bench")
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+import main
+from report import report
+
+
+async def login(app, sem, timings):
+    async with sem:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            r = await client.post("/login", data={"email": "bench@example.com", "password": "bench"})
+            timings.append(time.perf_counter() - start)
+            assert r.status_code == 302, r.status_code
+
+
+async def run(logins, concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", data={"email": "bench@example.com", "password": "bench"})
+
+    sem = asyncio.Semaphore(concurrency)
+    timings = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login(main.app, sem, timings) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    print(f"logins: {logins} (concurrency {concurrency}, {main.passwords.HASH_WORKERS} hash workers)")
+    report("/login", timings, elapsed, unit="logins")
+
+    main.passwords.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.logins, args.concurrency))
@@ -0,0 +1,151 @@
+import io
+import json
+import time
+import random
+import asyncio
+import base64
+import hashlib
+
+from aiohttp import web
+from PIL import Image
+
+# local stand-ins for the Telegram Bot API, OpenAI, ImgBB and the Graph API,
+# all on one aiohttp app. Every response is delayed by the configured latency
+# (seconds, +-20% jitter) for its service.
+
+
+def _png(width, height):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (random.randint(0, 255), 120, 200)).save(out, "PNG")
+    return out.getvalue()
+
+
+class MockServers:
+    def __init__(self, latency=None):
+        self.latency = {"telegram": 0.05, "openai": 1.0, "imgbb": 0.3, "graph": 0.3}
+        self.latency.update(latency or {})
+        self.images = {"generated.png": _png(1024, 1792), "photo.jpg": _png(1280, 960)}
+        self.calls = {}
+        self.message_id = 0
+        self.base_url = None
+        self.runner = None
+
+    async def delay(self, service):
+        self.calls[service] = self.calls.get(service, 0) + 1
+        await asyncio.sleep(self.latency[service] * random.uniform(0.8, 1.2))
+
+    # ---- Telegram ----
+
+    def message(self, chat_id, **extra):
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id if isinstance(chat_id, int) else -100, "type": "private"},
+            **extra
+        }
+
+    async def telegram(self, request):
+        await self.delay("telegram")
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        chat_id = int(data["chat_id"]) if str(data.get("chat_id", "")).lstrip("-").isdigit() else data.get("chat_id")
+
+        if method == "sendMessage":
+            result = self.message(chat_id, text=data.get("text", ""))
+        elif method == "sendPhoto":
+            photo = {"file_id": "p", "file_unique_id": "p", "width": 1, "height": 1}
+            result = self.message(chat_id, photo=[photo], caption=data.get("caption"))
+        elif method == "editMessageText":
+            result = self.message(chat_id, text=data.get("text", ""))
+        elif method == "getFile":
+            result = {"file_id": data["file_id"], "file_unique_id": "f", "file_path": "photo.jpg"}
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    # ---- OpenAI ----
+
+    async def chat(self, request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        text = f"Benchmark post about {prompt.strip().splitlines()[-1]}. " * 8 + "#bench #smm"
+        await self.delay("openai")
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in text.split(" "):
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(0.01)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def image(self, request):
+        await self.delay("openai")
+        return web.json_response({"data": [{"url": f"{self.base_url}/img/generated.png"}]})
+
+    # ---- ImgBB / Graph ----
+
+    async def imgbb(self, request):
+        await self.delay("imgbb")
+        data = await request.post()
+        content = base64.b64decode(data["image"])
+        name = hashlib.sha256(content).hexdigest() + ".jpg"
+        self.images[name] = content
+        return web.json_response({"data": {"display_url": f"{self.base_url}/img/{name}"}})
+
+    async def graph(self, request):
+        await self.delay("graph")
+        return web.json_response({"id": str(random.randint(1, 10 ** 9))})
+
+    async def serve_image(self, request):
+        content = self.images.get(request.match_info["name"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content, content_type="image/jpeg")
+
+    # ---- lifecycle ----
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post("/tg/bot{token}/{method}", self.telegram)
+        app.router.add_get("/tg/file/bot{token}/{name}", self.serve_image)
+        app.router.add_post("/openai/v1/chat/completions", self.chat)
+        app.router.add_post("/openai/v1/images/generations", self.image)
+        app.router.add_post("/imgbb/1/upload", self.imgbb)
+        app.router.add_post("/graph/v19.0/{path:.*}", self.graph)
+        app.router.add_get("/img/{name}", self.serve_image)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def env(self):
+        # settings that point the bot at these stand-ins
+        return {
+            "TELEGRAM_API_URL": f"{self.base_url}/tg",
+            "OPENAI_API_BASE": f"{self.base_url}/openai/v1",
+            "IMGBB_API_URL": f"{self.base_url}/imgbb/1/upload",
+            "GRAPH_API_URL": f"{self.base_url}/graph/v19.0"
+        }
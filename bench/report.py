@@ -0,0 +1,14 @@
+def percentile(timings, p):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+
+def report(name, timings, elapsed=None, unit="requests"):
+    line = (
+        f"{name:<24} n={len(timings):<6}"
+        f" p50={percentile(timings, 0.50) * 1000:8.1f} ms"
+        f" p99={percentile(timings, 0.99) * 1000:8.1f} ms"
+    )
+    if elapsed:
+        line += f"  {len(timings) / elapsed:8.1f} {unit}/sec"
+    print(line)
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# latency of the authenticated pages (/dashboard, /admin, /admin/logs) with a
+# seeded user table, in-process against a throwaway SQLite database:
+#
+#   python bench/web.py --users 10000 --requests 500 --concurrency 20
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "..", "backend")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("SESSION_SECRET", "bench")
+os.environ["ADMIN_EMAIL"] = "admin@example.com"
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+import main
+from database import SessionLocal
+from models import User, AdminLog
+from report import report
+
+
+def seed(users):
+    db = SessionLocal()
+    db.add_all(
+        User(email=f"user{i}@example.com", password="-", api_token=f"bench-{i}", tg_id=i if i % 2 else None)
+        for i in range(users)
+    )
+    db.add_all(
+        AdminLog(admin_email="admin@example.com", action="Reset token", target_email=f"user{i}@example.com")
+        for i in range(users)
+    )
+    db.commit()
+    db.close()
+
+
+async def client_for(email):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    await client.post("/register", data={"email": email, "password": "bench"})
+    await client.post("/login", data={"email": email, "password": "bench"})
+    return client
+
+
+async def hammer(client, path, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            r = await client.get(path)
+            timings.append(time.perf_counter() - start)
+            assert r.status_code == 200, (path, r.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    report(path, timings, time.perf_counter() - start)
+
+
+async def run(args):
+    seed(args.users)
+    user = await client_for("bench@example.com")
+    admin = await client_for("admin@example.com")
+
+    print(f"users: {args.users}, requests per page: {args.requests} (concurrency {args.concurrency})")
+    print()
+    await hammer(user, "/dashboard", args.requests, args.concurrency)
+    await hammer(admin, "/admin", args.requests, args.concurrency)
+    await hammer(admin, "/admin?q=user12", args.requests, args.concurrency)
+    await hammer(admin, "/admin/logs", args.requests, args.concurrency)
+
+    await user.aclose()
+    await admin.aclose()
+    main.passwords.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
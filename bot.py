@@ -1,57 +1,114 @@
 import os
 from dotenv import load_dotenv
 
-from db import SessionLocal
+load_dotenv()
+
+from sqlalchemy import select
+
+from db import AsyncSessionLocal, create_tables
 from models import User
 
 
+import re
 import asyncio
-import requests
-import openai
+import aiohttp
+from aiohttp import web
+from datetime import datetime, timedelta
+
+from http_client import post_form, close_session, ImageRejected
+import ai_client
+import cache
+import image_store
+import user_cache
+import publisher
+import rate_limit
+from rate_limit import RateLimited
+from backend import metrics
+from backend.metrics import timed
+from fsm_storage import get_storage, SQLStorage
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.fsm.storage.memory import MemoryStorage
 
 
-load_dotenv()
-
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-OPENAI_KEY = os.getenv("OPENAI_KEY")
 META_TOKEN = os.getenv("META_TOKEN")
-IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
 
 CHANNEL = os.getenv("CHANNEL")
 FB_PAGE_ID = os.getenv("FB_PAGE_ID")
 IG_USER_ID = os.getenv("IG_USER_ID")
 
-openai.api_key = OPENAI_KEY
+# API endpoints; overridden to point at local stand-ins in bench/
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com/v19.0")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# DALL·E urls expire after about an hour
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", "3000"))
+
+BATCH_MAX_POSTS = int(os.getenv("BATCH_MAX_POSTS", "30"))
+
+# offset of the time users type when scheduling a post
+SCHEDULE_UTC_OFFSET = int(os.getenv("SCHEDULE_UTC_OFFSET", "0"))
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+STREAM_POSTS = os.getenv("STREAM_POSTS", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
 
 
 # ================================
 # BOT INIT
 # ================================
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+if TELEGRAM_API_URL:
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    )
+else:
+    bot = Bot(token=BOT_TOKEN)
+dp = Dispatcher(storage=get_storage())
 
 # ================================
 #  TOKEN VERIFICATION
 # ================================
 
-def get_user_by_token(token):
-    db = SessionLocal()
-    user = db.query(User).filter(User.api_token == token).first()
-    db.close()
+# api tokens are secrets.token_hex(16); anything else is just chat text
+# and isn't worth a query or a cache entry
+TOKEN_RE = re.compile(r"[0-9a-f]{32}")
+
+async def get_user_by_token(token):
+    if not TOKEN_RE.fullmatch(token):
+        return None
+
+    found, user = user_cache.get(user_cache.by_token, token)
+    if found:
+        return user
+
+    with timed("db_user_lookup"):
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(User).where(User.api_token == token))
+
+    user_cache.put(user_cache.by_token, token, user)
     return user
 
-def get_user_by_tg(tg_id):
-    db = SessionLocal()
-    user = db.query(User).filter(User.tg_id == tg_id).first()
-    db.close()
+async def get_user_by_tg(tg_id):
+    found, user = user_cache.get(user_cache.by_tg, tg_id)
+    if found:
+        return user
+
+    with timed("db_user_lookup"):
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(User).where(User.tg_id == tg_id))
+
+    if user:
+        user_cache.put(user_cache.by_tg, tg_id, user)
     return user
 
 # ================================
@@ -69,6 +126,13 @@ class PostState(StatesGroup):
     edit_manual = State()
     edit_ai = State()
     choose_platform = State()
+    choose_time = State()
+    schedule_time = State()
+
+
+class BatchState(StatesGroup):
+    topics = State()
+    language = State()
 
 
 # ================================
@@ -89,6 +153,14 @@ def language_kb():
         [InlineKeyboardButton(text="🇬🇧 English", callback_data="en")]
     ])
 
+def batch_language_kb():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🇷🇺 Русский", callback_data="ru")],
+        [InlineKeyboardButton(text="🇰🇿 Қазақша", callback_data="kz")],
+        [InlineKeyboardButton(text="🇬🇧 English", callback_data="en")],
+        [InlineKeyboardButton(text="🌐 Все языки", callback_data="all")]
+    ])
+
 def post_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✏️ Редактировать вручную", callback_data="edit_manual")],
@@ -104,6 +176,12 @@ def platform_kb():
         [InlineKeyboardButton(text="🌍 Везде", callback_data="all")]
     ])
 
+def when_kb():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🚀 Сейчас", callback_data="now")],
+        [InlineKeyboardButton(text="⏰ Запланировать", callback_data="later")]
+    ])
+
 def restart_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔄 Начать заново", callback_data="restart")]
@@ -114,24 +192,27 @@ def restart_kb():
 # AI
 # ================================
 
-def ask_gpt(prompt):
+def chat_key(prompt):
+    return cache.make_key("chat", ai_client.CHAT_MODEL, prompt)
+
+async def ask_gpt(prompt, user_id=None, limit=ai_client.OPENAI_PER_USER):
     try:
-        r = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=900
+        return await cache.cached(
+            chat_key(prompt),
+            "chat",
+            lambda: ai_client.chat(prompt, user_id=user_id, max_tokens=900, limit=limit)
         )
-        return r["choices"][0]["message"]["content"]
     except:
         return "⚠️ Ошибка генерации."
 
-def generate_image(prompt):
-    result = openai.Image.create(
-        model="dall-e-3",
-        prompt=f"High quality social media image, vertical composition, {prompt}",
-        size="1024x1792"
+async def generate_image(prompt, user_id=None):
+    prompt = f"High quality social media image, vertical composition, {prompt}"
+    return await cache.cached(
+        cache.make_key("image", ai_client.IMAGE_MODEL, "1024x1792", prompt),
+        "image",
+        lambda: ai_client.image(prompt, user_id=user_id, size="1024x1792"),
+        ttl=IMAGE_CACHE_TTL
     )
-    return result["data"][0]["url"]
 
 GENERATOR_PROMPT = """
 Ты профессиональный SMM-копирайтер.
@@ -156,17 +237,71 @@ EDITOR_PROMPT = """
 {USER}
 """
 
-def generate_post(topic, lang):
+def post_prompt(topic, lang):
     lang_map = {
         "ru": "русском языке",
         "kz": "казахском языке",
         "en": "английском языке"
     }
-    return ask_gpt(GENERATOR_PROMPT.format(language=lang_map[lang]) + topic)
+    return GENERATOR_PROMPT.format(language=lang_map[lang]) + topic
+
+async def generate_post(topic, lang, user_id=None, limit=ai_client.OPENAI_PER_USER):
+    return await ask_gpt(post_prompt(topic, lang), user_id=user_id, limit=limit)
+
+async def stream_post(msg, topic, lang, user_id=None):
+    # shows the draft while it is generated; edits are throttled to
+    # STREAM_EDIT_INTERVAL to stay inside Telegram's edit rate limits
+    prompt = post_prompt(topic, lang)
+    key = chat_key(prompt)
+
+    hit = await cache.get(key, "chat")
+    if hit is not None:
+        return hit
+
+    draft = await msg.answer("✍️ Пишу пост...")
+    loop = asyncio.get_running_loop()
+    text = ""
+    shown = ""
+    next_edit = 0
+
+    try:
+        async for chunk in ai_client.stream_chat(prompt, user_id=user_id):
+            text += chunk
+
+            if loop.time() < next_edit or text.strip() == shown:
+                continue
+
+            try:
+                await draft.edit_text(text)
+                shown = text.strip()
+                next_edit = loop.time() + STREAM_EDIT_INTERVAL
+            except TelegramRetryAfter as e:
+                next_edit = loop.time() + e.retry_after
+            except TelegramBadRequest:
+                pass
+
+        if text.strip():
+            await cache.put(key, "chat", text.strip())
+        failed = not text.strip()
+    except Exception:
+        failed = True
+
+    try:
+        await draft.delete()
+    except TelegramBadRequest:
+        pass
+
+    # a stream cut off midway (or empty) would leave a broken post:
+    # generate it again in one piece, which reports its own errors
+    if failed:
+        return await generate_post(topic, lang, user_id=user_id)
 
-def edit_post(old, instruction):
-    return ask_gpt(
-        EDITOR_PROMPT.replace("{OLD}", old).replace("{USER}", instruction)
+    return text.strip()
+
+async def edit_post(old, instruction, user_id=None):
+    return await ask_gpt(
+        EDITOR_PROMPT.replace("{OLD}", old).replace("{USER}", instruction),
+        user_id=user_id
     )
 
 
@@ -174,35 +309,48 @@ def edit_post(old, instruction):
 # IMGBB
 # ================================
 
-def upload_imgbb(url):
-    r = requests.post(
-        "https://api.imgbb.com/1/upload",
-        data={"key": IMGBB_API_KEY, "image": url}
-    )
-    return r.json()["data"]["display_url"]
+# every platform gets its own variant, built from the original image when
+# it's added: Telegram file and DALL·E urls are gone by the time a
+# scheduled post goes out. Returns {platform: hosted url}.
+async def upload_imgbb(url, public_only=False):
+    return await image_store.rehost_variants(url, list(PLATFORM_NAMES), public_only)
 
 
 # ================================
 # META
 # ================================
 
+# Graph API reports throttling as error codes rather than HTTP 429
+GRAPH_THROTTLE_CODES = {4, 17, 32, 613}
+
+async def graph_post(path, data, platform):
+    async def call():
+        with timed("graph_api", platform):
+            r = await post_form(
+                f"{GRAPH_API_URL}/{path}",
+                data={**data, "access_token": META_TOKEN}
+            )
+        if "error" in r:
+            if r["error"].get("code") in GRAPH_THROTTLE_CODES:
+                raise RateLimited()
+            raise RuntimeError(r["error"].get("message", "Graph API error"))
+        return r
+
+    return await rate_limit.run("graph", META_TOKEN, call)
+
+# photo_url is the platform's own variant, see upload_imgbb
+
 async def post_facebook(photo_url, caption):
-    requests.post(
-        f"https://graph.facebook.com/v19.0/{FB_PAGE_ID}/photos",
-        data={"url": photo_url, "caption": caption, "access_token": META_TOKEN}
-    )
+    await graph_post(f"{FB_PAGE_ID}/photos", {"url": photo_url, "caption": caption}, "fb")
 
 async def post_instagram(photo_url, caption):
-    r = requests.post(
-        f"https://graph.facebook.com/v19.0/{IG_USER_ID}/media",
-        data={"image_url": photo_url, "caption": caption, "access_token": META_TOKEN}
+    # media_publish needs the container id, so these two stay sequential
+    r = await graph_post(
+        f"{IG_USER_ID}/media",
+        {"image_url": photo_url, "caption": caption},
+        "ig"
     )
-    cid = r.json().get("id")
-    if cid:
-        requests.post(
-            f"https://graph.facebook.com/v19.0/{IG_USER_ID}/media_publish",
-            data={"creation_id": cid, "access_token": META_TOKEN}
-        )
+    await graph_post(f"{IG_USER_ID}/media_publish", {"creation_id": r["id"]}, "ig")
 
 
 # ================================
@@ -211,7 +359,7 @@ async def post_instagram(photo_url, caption):
 
 @dp.message(Command("start"))
 async def start(msg: types.Message):
-    user = get_user_by_tg(msg.from_user.id)
+    user = await get_user_by_tg(msg.from_user.id)
 
     if user:
         await msg.answer("✅ Вы уже авторизованы. Напишите /menu")
@@ -221,7 +369,7 @@ async def start(msg: types.Message):
 
 @dp.message(Command("menu"))
 async def menu(msg: types.Message, state: FSMContext):
-    user = get_user_by_tg(msg.from_user.id)
+    user = await get_user_by_tg(msg.from_user.id)
 
     if not user:
         await msg.answer("🔐 Сначала введите токен через /start")
@@ -232,19 +380,122 @@ async def menu(msg: types.Message, state: FSMContext):
     
 @dp.message(Command("unlink"))
 async def unlink(msg: types.Message):
-    db = SessionLocal()
-    user = db.query(User).filter(User.tg_id == msg.from_user.id).first()
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.tg_id == msg.from_user.id))
+
+        if not user:
+            await msg.answer("Вы не привязаны.")
+            return
+
+        user.tg_id = None
+        user_cache.notify(db, user.id)
+        await db.commit()
+        user_cache.invalidate(user.id)
+
+    await msg.answer("🔓 Аккаунт отвязан. Теперь введите токен заново через /start")
+
+# ================================
+# BATCH
+# ================================
+
+LANGUAGE_NAMES = {
+    "ru": "🇷🇺 Русский",
+    "kz": "🇰🇿 Қазақша",
+    "en": "🇬🇧 English"
+}
+
+@dp.message(Command("batch"))
+async def batch(msg: types.Message, state: FSMContext):
+    user = await get_user_by_tg(msg.from_user.id)
 
     if not user:
-        db.close()
-        await msg.answer("Вы не привязаны.")
+        await msg.answer("🔐 Сначала введите токен через /start")
         return
 
-    user.tg_id = None
-    db.commit()
-    db.close()
+    await msg.answer("📝 Отправь темы, по одной в строке:")
+    await state.set_state(BatchState.topics)
+
+@dp.message(BatchState.topics)
+async def batch_topics(msg, state):
+    topics = [t.strip() for t in (msg.text or "").splitlines() if t.strip()]
+
+    if not topics:
+        await msg.answer("📝 Отправь хотя бы одну тему")
+        return
+
+    await state.update_data(topics=topics)
+    await msg.answer("🌍 Выбери язык:", reply_markup=batch_language_kb())
+    await state.set_state(BatchState.language)
+
+@dp.callback_query(BatchState.language, lambda c: c.data in LANGUAGE_NAMES or c.data == "all")
+async def batch_language(call, state):
+    data = await state.get_data()
+    langs = list(LANGUAGE_NAMES) if call.data == "all" else [call.data]
+    jobs = [(topic, lang) for topic in data["topics"] for lang in langs]
+
+    if len(jobs) > BATCH_MAX_POSTS:
+        await call.message.answer(f"❌ Не больше {BATCH_MAX_POSTS} постов за раз")
+        return
+
+    await state.clear()
+    await call.message.answer(f"⏳ Генерирую {len(jobs)} постов...")
+
+    # all posts are generated at once; the per-user cap for batches is
+    # OPENAI_BATCH_PER_USER and doesn't eat into the interactive one
+    texts = await asyncio.gather(*(
+        generate_post(
+            topic, lang,
+            user_id=("batch", call.from_user.id),
+            limit=ai_client.OPENAI_BATCH_PER_USER
+        )
+        for topic, lang in jobs
+    ))
+
+    for topic in data["topics"]:
+        parts = [
+            f"{LANGUAGE_NAMES[lang]}\n{text}"
+            for (t, lang), text in zip(jobs, texts) if t == topic
+        ]
+        await send_grouped(call.message, f"📌 {topic}", parts)
+
+    await call.message.answer("✅ Готово!", reply_markup=restart_kb())
+
+def split_text(text, limit=4096):
+    # at a line break or space where possible, mid-word only as a last resort
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    return pieces + [text]
+
+async def send_grouped(msg, title, parts):
+    # one message per topic, split only where Telegram's 4096 limit forces
+    # it; a section longer than that is spread over several messages
+    chunk = title
+    for part in parts:
+        if len(chunk) + len(part) + 2 <= 4096:
+            chunk += "\n\n" + part
+            continue
+
+        # the title never goes out on its own, it opens the first piece
+        if chunk == title:
+            full = split_text(part, 4096 - len(title) - 2)
+            full[0] = title + "\n\n" + full[0]
+        else:
+            await msg.answer(chunk)
+            full = split_text(part)
+        chunk = full.pop()
+        for piece in full:
+            await msg.answer(piece)
+
+    if chunk:
+        await msg.answer(chunk)
 
-    await msg.answer("🔓 Аккаунт отвязан. Теперь введите токен заново через /start")
 
 # ================================
 # RESTART BUTTON
@@ -295,11 +546,11 @@ async def choose_image(call, state):
 async def photo(msg, state):
     file_id = msg.photo[-1].file_id
     file = await bot.get_file(file_id)
-    tg_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
+    tg_url = bot.session.api.file_url(BOT_TOKEN, file.file_path)
 
-    url = upload_imgbb(tg_url)
+    photos = await upload_imgbb(tg_url)
 
-    await state.update_data(photo_url=url)
+    await state.update_data(photo_url=photos["tg"], photos=photos)
     await msg.answer("🌍 Выбери язык:", reply_markup=language_kb())
     await state.set_state(PostState.language)
 
@@ -310,8 +561,13 @@ async def photo(msg, state):
 
 @dp.message(PostState.link)
 async def link(msg, state):
-    url = upload_imgbb(msg.text)
-    await state.update_data(photo_url=url)
+    try:
+        photos = await upload_imgbb((msg.text or "").strip(), public_only=True)
+    except (ImageRejected, aiohttp.ClientError, asyncio.TimeoutError):
+        await msg.answer("❌ Не удалось загрузить изображение по ссылке. Пришли другую ссылку:")
+        return
+
+    await state.update_data(photo_url=photos["tg"], photos=photos)
     await msg.answer("🌍 Выбери язык:", reply_markup=language_kb())
     await state.set_state(PostState.language)
 
@@ -324,10 +580,10 @@ async def link(msg, state):
 async def gen_image(msg, state):
     await msg.answer("🎨 Генерирую изображение...")
 
-    img_url = generate_image(msg.text)
-    hosted = upload_imgbb(img_url)
+    img_url = await generate_image(msg.text, user_id=msg.from_user.id)
+    photos = await upload_imgbb(img_url)
 
-    await state.update_data(photo_url=hosted)
+    await state.update_data(photo_url=photos["tg"], photos=photos)
     await msg.answer("🌍 Выбери язык:", reply_markup=language_kb())
     await state.set_state(PostState.language)
 
@@ -348,7 +604,10 @@ async def set_lang(call, state):
 
 async def create_post(msg, state):
     data = await state.get_data()
-    text = generate_post(data["topic"], data["language"])
+    if STREAM_POSTS:
+        text = await stream_post(msg, data["topic"], data["language"], user_id=state.key.user_id)
+    else:
+        text = await generate_post(data["topic"], data["language"], user_id=state.key.user_id)
 
     await state.update_data(text=text)
 
@@ -388,7 +647,7 @@ async def ai_edit(call, state):
 @dp.message(PostState.edit_ai)
 async def save_ai(msg, state):
     data = await state.get_data()
-    new = edit_post(data["text"], msg.text)
+    new = await edit_post(data["text"], msg.text, user_id=msg.from_user.id)
 
     await state.update_data(text=new)
     await create_preview(msg, state)
@@ -413,23 +672,85 @@ async def publish(call, state):
     await call.message.answer("🚀 Куда публиковать?", reply_markup=platform_kb())
     await state.set_state(PostState.choose_platform)
 
-@dp.callback_query(PostState.choose_platform)
+PLATFORM_NAMES = {
+    "tg": "Telegram",
+    "ig": "Instagram",
+    "fb": "Facebook"
+}
+
+# callbacks are filtered by value too: a stale button (or a double tap on
+# the previous keyboard) falls through to restart or is ignored
+
+@dp.callback_query(PostState.choose_platform, lambda c: c.data in PLATFORM_NAMES or c.data == "all")
 async def platform(call, state):
+    platforms = list(PLATFORM_NAMES) if call.data == "all" else [call.data]
+    await state.update_data(platforms=platforms)
+    await call.message.answer("🕒 Когда публиковать?", reply_markup=when_kb())
+    await state.set_state(PostState.choose_time)
+
+@dp.callback_query(PostState.choose_time, lambda c: c.data in ("now", "later"))
+async def choose_time(call, state):
+    if call.data == "later":
+        await call.message.answer("⏰ Введи дату и время: ДД.ММ.ГГГГ ЧЧ:ММ")
+        await state.set_state(PostState.schedule_time)
+    elif call.data == "now":
+        await schedule_post(call.message, state, datetime.utcnow())
+
+@dp.message(PostState.schedule_time)
+async def schedule_time(msg, state):
+    try:
+        local = datetime.strptime(msg.text.strip(), "%d.%m.%Y %H:%M")
+    except (ValueError, AttributeError):
+        await msg.answer("❌ Формат: ДД.ММ.ГГГГ ЧЧ:ММ")
+        return
+
+    run_at = local - timedelta(hours=SCHEDULE_UTC_OFFSET)
+    if run_at <= datetime.utcnow():
+        await msg.answer("❌ Это время уже прошло. Введи время в будущем:")
+        return
+
+    await schedule_post(msg, state, run_at)
+
+async def schedule_post(msg, state, run_at):
+    # publishing happens in publisher's workers; the chat gets a
+    # message per platform once its job is done or has given up
     data = await state.get_data()
+    photos = data.get("photos") or {p: data["photo_url"] for p in data["platforms"]}
+    await publisher.enqueue(
+        data["platforms"], msg.chat.id, photos, data["text"], run_at
+    )
 
-    if call.data in ["tg", "all"]:
-        await bot.send_photo(CHANNEL, data["photo_url"], caption=data["text"])
+    if run_at <= datetime.utcnow():
+        text = "⏳ Пост поставлен в очередь на публикацию"
+    else:
+        text = "📅 Пост запланирован"
 
-    if call.data in ["ig", "all"]:
-        await post_instagram(data["photo_url"], data["text"])
+    await state.clear()
+    await msg.answer(text, reply_markup=restart_kb())
 
-    if call.data in ["fb", "all"]:
-        await post_facebook(data["photo_url"], data["text"])
 
-    await call.message.answer(
-        "✅ Пост опубликован!",
-        reply_markup=restart_kb()
-    )
+async def post_telegram(photo_url, caption):
+    async def call():
+        try:
+            with timed("telegram_send", "tg"):
+                await bot.send_photo(CHANNEL, photo_url, caption=caption)
+        except TelegramRetryAfter as e:
+            raise RateLimited(e.retry_after)
+
+    await rate_limit.run("telegram", CHANNEL, call)
+
+PUBLISHERS = {
+    "tg": post_telegram,
+    "ig": post_instagram,
+    "fb": post_facebook
+}
+
+async def notify_published(job, status):
+    if status == "done":
+        text = f"✅ Пост опубликован: {PLATFORM_NAMES[job.platform]}"
+    else:
+        text = f"❌ Не удалось опубликовать: {PLATFORM_NAMES[job.platform]}"
+    await bot.send_message(job.chat_id, text)
 
 @dp.message()
 async def receive_token(msg: types.Message):
@@ -438,22 +759,34 @@ async def receive_token(msg: types.Message):
 
     token = msg.text.strip()
 
-    db = SessionLocal()
-    user = db.query(User).filter(User.api_token == token).first()
-
-    if not user:
-        db.close()
+    # most free text is not a token; answer those from the cache
+    if not await get_user_by_token(token):
         await msg.answer("❌ Неверный токен")
         return
 
-    if user.tg_id is not None and user.tg_id != msg.from_user.id:
-        db.close()
-        await msg.answer("❌ Этот токен уже используется")
-        return
+    with timed("db_user_lookup"):
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(User).where(User.api_token == token))
 
-    user.tg_id = msg.from_user.id
-    db.commit()
-    db.close()
+        if not user:
+            await msg.answer("❌ Неверный токен")
+            return
+
+        if user.tg_id is not None and user.tg_id != msg.from_user.id:
+            await msg.answer("❌ Этот токен уже используется")
+            return
+
+        other = await db.scalar(
+            select(User).where(User.tg_id == msg.from_user.id, User.id != user.id)
+        )
+        if other:
+            await msg.answer("❌ Этот Telegram уже привязан к другому аккаунту. Сначала /unlink")
+            return
+
+        user.tg_id = msg.from_user.id
+        user_cache.notify(db, user.id)
+        await db.commit()
+        user_cache.invalidate(user.id)
 
     await msg.answer("✅ Аккаунт привязан! Напишите /menu")
 
@@ -464,8 +797,46 @@ async def receive_token(msg: types.Message):
 # RUN
 # ================================
 
+async def serve_metrics():
+    # Prometheus exporter for the polling runtime; webhook mode serves
+    # /metrics on webhook_app instead
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, port=METRICS_PORT).start()
+
+async def expire_drafts():
+    while True:
+        await asyncio.sleep(3600)
+        await dp.storage.expire_idle()
+
 async def main():
-    await dp.start_polling(bot)
+    create_tables()
+    tasks = [asyncio.create_task(user_cache.watch_invalidations())]
+    tasks.extend(publisher.start(PUBLISHERS, notify_published))
+
+    if METRICS_PORT:
+        await serve_metrics()
+
+    if isinstance(dp.storage, SQLStorage):
+        tasks.append(asyncio.create_task(expire_drafts()))
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_session()
 
 if __name__ == "__main__":
+    # webhook.py imports this module as `bot`; starting it from here would
+    # build a second Bot, Dispatcher and storage next to this __main__ copy
+    if os.getenv("WEBHOOK_URL"):
+        raise SystemExit("WEBHOOK_URL is set: run `python webhook.py` instead")
+
     asyncio.run(main())
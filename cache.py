@@ -0,0 +1,108 @@
+import os
+import json
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+from db import SessionLocal
+from models import GenerationCache
+from backend import metrics
+
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+LOOKUPS = metrics.Counter(
+    "smm_generation_cache_lookups_total",
+    "Generation cache lookups by kind and result (hit or miss)"
+)
+
+
+# ================================
+# KEYS
+# ================================
+
+def normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+def make_key(kind, model, *parts):
+    raw = json.dumps([kind, model] + [normalize(p) for p in parts], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ================================
+# STORAGE
+# ================================
+
+def _get(key):
+    db = SessionLocal()
+    entry = db.query(GenerationCache).filter(GenerationCache.key == key).first()
+    now = datetime.utcnow()
+
+    if not entry:
+        db.close()
+        return None
+
+    if entry.expires_at < now:
+        db.delete(entry)
+        db.commit()
+        db.close()
+        return None
+
+    entry.used_at = now
+    value = entry.value
+    db.commit()
+    db.close()
+    return value
+
+def _put(key, kind, value, ttl):
+    db = SessionLocal()
+    now = datetime.utcnow()
+
+    db.merge(GenerationCache(
+        key=key,
+        kind=kind,
+        value=value,
+        expires_at=now + timedelta(seconds=ttl),
+        used_at=now
+    ))
+    # sessions don't autoflush: the new entry has to count toward the cap
+    db.flush()
+
+    # expired first, then least recently used beyond the size cap
+    db.query(GenerationCache).filter(GenerationCache.expires_at < now).delete()
+
+    overflow = db.query(GenerationCache).count() - CACHE_MAX_ENTRIES
+    if overflow > 0:
+        oldest = (
+            db.query(GenerationCache.key)
+            .order_by(GenerationCache.used_at)
+            .limit(overflow)
+            .subquery()
+        )
+        db.query(GenerationCache).filter(
+            GenerationCache.key.in_(oldest.select())
+        ).delete(synchronize_session=False)
+
+    db.commit()
+    db.close()
+
+
+async def get(key, kind=""):
+    value = await asyncio.to_thread(_get, key)
+    LOOKUPS.inc(kind=kind, result="hit" if value is not None else "miss")
+    return value
+
+async def put(key, kind, value, ttl=CACHE_TTL):
+    await asyncio.to_thread(_put, key, kind, value, ttl)
+
+async def cached(key, kind, factory, ttl=CACHE_TTL):
+    value = await get(key, kind)
+    if value is not None:
+        return value
+
+    value = await factory()
+    await put(key, kind, value, ttl)
+    return value
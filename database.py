@@ -1,17 +1,7 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import declarative_base
 
-DATABASE_URL = "sqlite:///./app.db"
-
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-
-SessionLocal = sessionmaker(
-    bind=engine,
-    autoflush=False,
-    autocommit=False
-)
+# one set of connection pools per process: the engines and sessions are the
+# web app's; only the declarative Base is separate, for the bot's own models
+from backend.database import engine, async_engine, SessionLocal, AsyncSessionLocal
 
 Base = declarative_base()
@@ -1,16 +1,10 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from database import engine, SessionLocal, async_engine, AsyncSessionLocal, Base
 from models import User
 
-DATABASE_URL = "sqlite:///backend/app.db"
-
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-
-SessionLocal = sessionmaker(
-    bind=engine,
-    autoflush=False,
-    autocommit=False
-)
+def create_tables():
+    # the bot's own tables, created once at startup; users belongs to the
+    # web app and its migrations
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[t for t in Base.metadata.sorted_tables if t is not User.__table__]
+    )
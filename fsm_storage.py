@@ -0,0 +1,135 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from db import SessionLocal, engine
+from models import FSMRecord
+
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sql")
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 3600)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+# ================================
+# SQL STORAGE
+# ================================
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SQLStorage(BaseStorage):
+    # one row per conversation; state and data are upserted separately so
+    # concurrent writers from several bot processes never clobber each other
+
+    def __init__(self, ttl=FSM_TTL):
+        self.ttl = timedelta(seconds=ttl)
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True)
+
+    def _insert(self):
+        if engine.dialect.name == "postgresql":
+            return postgresql.insert(FSMRecord)
+        return sqlite.insert(FSMRecord)
+
+    def _upsert(self, key, **values):
+        now = datetime.utcnow()
+        values["updated_at"] = now
+
+        # writing one column of an expired row must not bring the
+        # other one back to life
+        update = dict(values)
+        for column in ("state", "data"):
+            if column not in values:
+                update[column] = case(
+                    (FSMRecord.updated_at < now - self.ttl, None),
+                    else_=getattr(FSMRecord, column)
+                )
+
+        stmt = self._insert().values(key=key, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=["key"], set_=update)
+
+        db = SessionLocal()
+        db.execute(stmt)
+        db.commit()
+        db.close()
+
+    def _get(self, key):
+        cutoff = datetime.utcnow() - self.ttl
+
+        db = SessionLocal()
+        record = db.query(FSMRecord).filter(FSMRecord.key == key).first()
+
+        if record and record.updated_at < cutoff:
+            db.query(FSMRecord).filter(
+                FSMRecord.key == key,
+                FSMRecord.updated_at < cutoff
+            ).delete()
+            db.commit()
+            record = None
+
+        db.close()
+        return record
+
+    def _cleanup(self):
+        db = SessionLocal()
+        db.query(FSMRecord).filter(
+            FSMRecord.updated_at < datetime.utcnow() - self.ttl
+        ).delete()
+        db.commit()
+        db.close()
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(self._upsert, self.key_builder.build(key), state=state)
+
+    async def get_state(self, key):
+        record = await asyncio.to_thread(self._get, self.key_builder.build(key))
+        return record.state if record else None
+
+    async def set_data(self, key, data):
+        await asyncio.to_thread(
+            self._upsert,
+            self.key_builder.build(key),
+            data=dumps(data) if data else None
+        )
+
+    async def get_data(self, key):
+        record = await asyncio.to_thread(self._get, self.key_builder.build(key))
+        if not record or not record.data:
+            return {}
+        return json.loads(record.data)
+
+    async def expire_idle(self):
+        await asyncio.to_thread(self._cleanup)
+
+    async def close(self):
+        pass
+
+
+# ================================
+# FACTORY
+# ================================
+
+def get_storage():
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+
+    if FSM_STORAGE == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True),
+            state_ttl=FSM_TTL,
+            data_ttl=FSM_TTL
+        )
+
+    return SQLStorage()
@@ -0,0 +1,147 @@
+import os
+import socket
+import asyncio
+import ipaddress
+
+import aiohttp
+from aiohttp.resolver import ThreadedResolver
+from yarl import URL
+
+from rate_limit import RateLimited, parse_retry_after
+
+
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "200"))
+HTTP_PER_HOST = int(os.getenv("HTTP_PER_HOST", "20"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "30"))
+
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_MAX_REDIRECTS = 3
+
+
+class ImageRejected(Exception):
+    pass
+
+
+# ================================
+# PUBLIC ADDRESSES
+# ================================
+
+# urls typed by users are fetched on our side, so they must not reach
+# loopback, private, link-local or other internal addresses
+
+def is_public(address):
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+def check_public_url(url):
+    url = URL(url)
+    if url.scheme not in ("http", "https") or not url.host:
+        raise ImageRejected(f"Unsupported url: {url}")
+
+    try:
+        literal = not is_public(url.host)
+    except ValueError:
+        return
+
+    if literal:
+        raise ImageRejected(f"Address not allowed: {url.host}")
+
+
+class PublicResolver(ThreadedResolver):
+    # checked at connect time, so a name can't resolve to a public
+    # address for the check and to an internal one for the request
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        hosts = await super().resolve(host, port, family)
+        for h in hosts:
+            if not is_public(h["host"]):
+                raise OSError(f"Address not allowed: {host} -> {h['host']}")
+        return hosts
+
+
+# ================================
+# SHARED SESSION
+# ================================
+
+# one session for our own API calls and one, with PublicResolver,
+# for urls that come from users
+_sessions = {}
+_lock = asyncio.Lock()
+
+
+async def get_session(public_only=False):
+    session = _sessions.get(public_only)
+    if session is not None and not session.closed:
+        return session
+
+    async with _lock:
+        session = _sessions.get(public_only)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                limit_per_host=HTTP_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE,
+                ttl_dns_cache=300,
+                resolver=PublicResolver() if public_only else None
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=HTTP_TOTAL_TIMEOUT,
+                connect=HTTP_CONNECT_TIMEOUT
+            )
+            session = _sessions[public_only] = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    return session
+
+
+async def close_session():
+    for session in _sessions.values():
+        if not session.closed:
+            await session.close()
+    _sessions.clear()
+
+
+# ================================
+# REQUESTS
+# ================================
+
+async def post_form(url, data):
+    session = await get_session()
+    async with session.post(url, data=data) as r:
+        if r.status == 429:
+            raise RateLimited(parse_retry_after(r.headers.get("Retry-After")))
+        return await r.json(content_type=None)
+
+async def _read_capped(r, limit):
+    if r.content_length is not None and r.content_length > limit:
+        raise ImageRejected(f"Image larger than {limit} bytes")
+
+    body = bytearray()
+    async for chunk in r.content.iter_chunked(64 * 1024):
+        body += chunk
+        if len(body) > limit:
+            raise ImageRejected(f"Image larger than {limit} bytes")
+    return bytes(body)
+
+async def get_image(url, public_only=False):
+    # public_only: url comes from a user. Redirects are followed by hand
+    # so every hop is checked, and the response must say it's an image
+    session = await get_session(public_only)
+
+    for _ in range(IMAGE_MAX_REDIRECTS + 1):
+        if public_only:
+            check_public_url(url)
+
+        async with session.get(url, allow_redirects=not public_only) as r:
+            if public_only and r.status in (301, 302, 303, 307, 308) and "Location" in r.headers:
+                url = str(r.url.join(URL(r.headers["Location"])))
+                continue
+
+            r.raise_for_status()
+            if public_only and not r.content_type.startswith("image/"):
+                raise ImageRejected(f"Not an image: {r.content_type}")
+            return await _read_capped(r, IMAGE_MAX_BYTES)
+
+    raise ImageRejected("Too many redirects")
@@ -0,0 +1,64 @@
+import io
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+IMAGE_PAD_COLOR = os.getenv("IMAGE_PAD_COLOR", "white")
+
+# max size, allowed width/height ratio and encoding per target.
+# The Telegram variant doubles as the preview hosted when a user adds an image.
+SPECS = {
+    "tg": {"max_width": 1280, "max_height": 2048, "ratio": (1 / 20, 20), "format": "JPEG"},
+    "ig": {"max_width": 1080, "max_height": 1350, "ratio": (4 / 5, 1.91), "format": "JPEG"},
+    "fb": {"max_width": 2048, "max_height": 2048, "ratio": None, "format": "JPEG"}
+}
+
+EXTENSIONS = {"JPEG": "jpg"}
+
+# Pillow releases the GIL while resizing and encoding, so threads are enough
+_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+
+
+# ================================
+# PROCESSING
+# ================================
+
+def fit_ratio(image, ratio):
+    # pad (never crop) the image until its width/height ratio is allowed
+    low, high = ratio
+    width, height = image.size
+    current = width / height
+
+    if current < low:
+        size = (round(height * low), height)
+    elif current > high:
+        size = (width, round(width / high))
+    else:
+        return image
+
+    return ImageOps.pad(image, size, color=IMAGE_PAD_COLOR)
+
+def _process(content, target):
+    spec = SPECS[target]
+
+    image = Image.open(io.BytesIO(content))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    if spec["ratio"]:
+        image = fit_ratio(image, spec["ratio"])
+
+    image.thumbnail((spec["max_width"], spec["max_height"]), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, spec["format"], quality=IMAGE_QUALITY, optimize=True)
+    return out.getvalue(), EXTENSIONS[spec["format"]]
+
+
+async def process(content, target):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, _process, content, target)
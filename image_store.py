@@ -0,0 +1,138 @@
+import os
+import base64
+import asyncio
+import hashlib
+import logging
+
+from db import SessionLocal
+from models import HostedImage
+from http_client import post_form, get_image, ImageRejected
+import rate_limit
+import image_pipeline
+from backend.metrics import timed
+
+
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "imgbb")
+IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
+IMGBB_API_URL = os.getenv("IMGBB_API_URL", "https://api.imgbb.com/1/upload")
+
+# local backend: files go to IMAGE_STORAGE_DIR and are served from IMAGE_STORAGE_URL
+IMAGE_STORAGE_DIR = os.getenv("IMAGE_STORAGE_DIR", "./images")
+IMAGE_STORAGE_URL = os.getenv("IMAGE_STORAGE_URL", "http://localhost:8000/images")
+
+log = logging.getLogger(__name__)
+
+
+# ================================
+# STORAGE BACKENDS
+# ================================
+
+class ImgBBStorage:
+    async def upload(self, content, name):
+        image = base64.b64encode(content).decode()
+        r = await rate_limit.run(
+            "imgbb", IMGBB_API_KEY,
+            lambda: post_form(
+                IMGBB_API_URL,
+                data={"key": IMGBB_API_KEY, "image": image}
+            )
+        )
+        return r["data"]["display_url"]
+
+
+class LocalStorage:
+    def __init__(self, directory, base_url):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, path, content):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+    async def upload(self, content, name):
+        await asyncio.to_thread(self._write, os.path.join(self.directory, name), content)
+        return f"{self.base_url}/{name}"
+
+
+def get_storage():
+    if IMAGE_STORAGE == "local":
+        return LocalStorage(IMAGE_STORAGE_DIR, IMAGE_STORAGE_URL)
+    return ImgBBStorage()
+
+storage = get_storage()
+
+
+# ================================
+# DEDUP
+# ================================
+
+def _find(column, value):
+    db = SessionLocal()
+    image = db.query(HostedImage).filter(column == value).first()
+    db.close()
+    return image.display_url if image else None
+
+def _save(source_key, content_hash, display_url):
+    db = SessionLocal()
+    db.add(HostedImage(
+        source_key=source_key,
+        content_hash=content_hash,
+        display_url=display_url
+    ))
+    db.commit()
+    db.close()
+
+
+def sha256(value):
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return hashlib.sha256(value).hexdigest()
+
+
+async def _host_variant(content, target):
+    content_hash = f"{target}:{sha256(content)}"
+
+    hosted = await asyncio.to_thread(_find, HostedImage.content_hash, content_hash)
+    if hosted:
+        return content_hash, hosted
+
+    # bytes Pillow can't decode are never hosted
+    try:
+        with timed("image_process", target):
+            processed, ext = await image_pipeline.process(content, target)
+    except Exception as e:
+        log.warning("Can't process image for %s: %r", target, e)
+        raise ImageRejected(f"Can't decode image: {e!r}") from e
+
+    with timed("image_upload", target):
+        hosted = await storage.upload(processed, f"{sha256(processed)}.{ext}")
+    return content_hash, hosted
+
+
+async def rehost_variants(url, targets, public_only=False):
+    # hosts the image_pipeline variant of url for every target, all built
+    # from one download of the original, memoized by the source url and by
+    # the source bytes. Source urls can carry the bot token, so only their
+    # hash is stored. public_only is for urls typed by users, see
+    # http_client.get_image. Returns {target: hosted url}.
+    source_keys = {target: sha256(f"{target}:{url}") for target in targets}
+
+    hosted = {}
+    for target, source_key in source_keys.items():
+        found = await asyncio.to_thread(_find, HostedImage.source_key, source_key)
+        if found:
+            hosted[target] = found
+
+    missing = [target for target in targets if target not in hosted]
+    if not missing:
+        return hosted
+
+    content = await get_image(url, public_only)
+    variants = await asyncio.gather(*(_host_variant(content, target) for target in missing))
+
+    for target, (content_hash, display_url) in zip(missing, variants):
+        await asyncio.to_thread(_save, source_keys[target], content_hash, display_url)
+        hosted[target] = display_url
+
+    return hosted
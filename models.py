@@ -7,5 +7,55 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, index=True)
     password = Column(String)
-    api_token = Column(String)
-    tg_id = Column(Integer, nullable=True)
+    api_token = Column(String, unique=True, index=True)
+    tg_id = Column(Integer, nullable=True, unique=True, index=True)
+
+from sqlalchemy import DateTime, Text
+from datetime import datetime
+
+class GenerationCache(Base):
+    __tablename__ = "generation_cache"
+
+    key = Column(String, primary_key=True)
+    kind = Column(String)
+    value = Column(Text)
+    expires_at = Column(DateTime, index=True)
+    used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class HostedImage(Base):
+    __tablename__ = "hosted_images"
+
+    id = Column(Integer, primary_key=True)
+    source_key = Column(String, index=True)
+    content_hash = Column(String, index=True)
+    display_url = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FSMRecord(Base):
+    __tablename__ = "fsm_records"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class UserInvalidation(Base):
+    __tablename__ = "user_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class PublishJob(Base):
+    __tablename__ = "publish_jobs"
+
+    id = Column(Integer, primary_key=True)
+    platform = Column(String)
+    chat_id = Column(Integer)
+    photo_url = Column(String)
+    text = Column(Text)
+    status = Column(String, default="pending", index=True)
+    run_at = Column(DateTime, default=datetime.utcnow, index=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
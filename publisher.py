@@ -0,0 +1,157 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from db import SessionLocal
+from models import PublishJob
+
+
+PUBLISH_TIMEOUT = float(os.getenv("PUBLISH_TIMEOUT", "120"))
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", "4"))
+PUBLISH_RATE = float(os.getenv("PUBLISH_RATE", "5"))
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "5"))
+PUBLISH_POLL = float(os.getenv("PUBLISH_POLL", "2"))
+
+# first retry delay per platform in seconds, doubled on every attempt
+PUBLISH_BACKOFF = {
+    "tg": float(os.getenv("PUBLISH_BACKOFF_TG", "5")),
+    "ig": float(os.getenv("PUBLISH_BACKOFF_IG", "30")),
+    "fb": float(os.getenv("PUBLISH_BACKOFF_FB", "30"))
+}
+
+log = logging.getLogger(__name__)
+
+
+# ================================
+# JOB STORE
+# ================================
+
+def _enqueue(platforms, chat_id, photos, text, run_at):
+    db = SessionLocal()
+    for platform in platforms:
+        db.add(PublishJob(
+            platform=platform,
+            chat_id=chat_id,
+            photo_url=photos[platform],
+            text=text,
+            run_at=run_at
+        ))
+    db.commit()
+    db.close()
+
+def _claim(limit):
+    # a claimed job is leased until run_at; if the process dies mid-publish
+    # the lease runs out and another worker picks the job up again
+    db = SessionLocal()
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=PUBLISH_TIMEOUT * 3)
+
+    due = (
+        db.query(PublishJob)
+        .filter(PublishJob.status.in_(["pending", "running"]), PublishJob.run_at <= now)
+        .order_by(PublishJob.run_at)
+        .limit(limit)
+        .all()
+    )
+
+    claimed = []
+    for job in due:
+        r = db.execute(
+            update(PublishJob)
+            .where(PublishJob.id == job.id, PublishJob.run_at == job.run_at)
+            .values(status="running", run_at=lease)
+        )
+        if r.rowcount:
+            claimed.append(job.id)
+    db.commit()
+
+    jobs = db.query(PublishJob).filter(PublishJob.id.in_(claimed)).all() if claimed else []
+    db.close()
+    return jobs
+
+def _finish(job_id, error=None):
+    db = SessionLocal()
+    job = db.get(PublishJob, job_id)
+
+    if error is None:
+        job.status = "done"
+        job.last_error = None
+    else:
+        job.attempts += 1
+        job.last_error = error
+        if job.attempts >= PUBLISH_MAX_ATTEMPTS:
+            job.status = "failed"
+        else:
+            delay = PUBLISH_BACKOFF.get(job.platform, 30) * 2 ** (job.attempts - 1)
+            job.status = "pending"
+            job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    status = job.status
+    db.commit()
+    db.close()
+    return status
+
+
+async def enqueue(platforms, chat_id, photos, text, run_at=None):
+    # photos: {platform: url of that platform's image variant}
+    await asyncio.to_thread(
+        _enqueue, platforms, chat_id, photos, text, run_at or datetime.utcnow()
+    )
+
+
+# ================================
+# WORKERS
+# ================================
+
+async def _run(job, publishers, notify):
+    try:
+        await asyncio.wait_for(
+            publishers[job.platform](job.photo_url, job.text),
+            PUBLISH_TIMEOUT
+        )
+        error = None
+    except Exception as e:
+        log.warning("Publish job %s (%s) failed: %r", job.id, job.platform, e)
+        error = repr(e)
+
+    status = await asyncio.to_thread(_finish, job.id, error)
+    if status in ("done", "failed"):
+        await notify(job, status)
+
+
+async def worker(queue, publishers, notify):
+    while True:
+        job = await queue.get()
+        try:
+            await _run(job, publishers, notify)
+        except Exception:
+            log.exception("Publish job %s crashed", job.id)
+        finally:
+            queue.task_done()
+
+
+async def poller(queue):
+    # jobs are handed out at most PUBLISH_RATE per second, so a burst of
+    # posts is drained at a steady pace instead of all at once
+    while True:
+        jobs = await asyncio.to_thread(_claim, PUBLISH_WORKERS)
+
+        for job in jobs:
+            await queue.put(job)
+            await asyncio.sleep(1 / PUBLISH_RATE)
+
+        if not jobs:
+            await asyncio.sleep(PUBLISH_POLL)
+
+
+def start(publishers, notify):
+    # publishers: {platform: async fn(photo_url, text)}
+    # notify: async fn(job, status) called once a job is done or gave up
+    queue = asyncio.Queue(maxsize=PUBLISH_WORKERS)
+    tasks = [asyncio.create_task(poller(queue))]
+    for _ in range(PUBLISH_WORKERS):
+        tasks.append(asyncio.create_task(worker(queue, publishers, notify)))
+    return tasks
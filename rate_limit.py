@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+
+
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "5"))
+RATE_LIMIT_DEFAULT_DELAY = float(os.getenv("RATE_LIMIT_DEFAULT_DELAY", "30"))
+
+# requests per second and burst size per endpoint, overridable with
+# e.g. RATE_LIMIT_GRAPH="0.5:10"
+LIMITS = {
+    "telegram": (0.33, 5),
+    "graph": (0.5, 10),
+    "imgbb": (2, 10),
+    "openai": (5, 20)
+}
+
+for _name in LIMITS:
+    _value = os.getenv(f"RATE_LIMIT_{_name.upper()}")
+    if _value:
+        _rate, _burst = _value.split(":")
+        LIMITS[_name] = (float(_rate), int(_burst))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ================================
+# TOKEN BUCKET
+# ================================
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        # asyncio.Lock wakes waiters in order, so callers are served FIFO
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        # the server told us to back off: nobody on this bucket sends until then
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+_buckets = {}
+
+def bucket(endpoint, credential=None):
+    key = (endpoint, credential)
+    if key not in _buckets:
+        _buckets[key] = TokenBucket(*LIMITS[endpoint])
+    return _buckets[key]
+
+
+# ================================
+# CALLS
+# ================================
+
+async def run(endpoint, credential, make_call):
+    # make_call raises RateLimited when throttled; the call then waits in
+    # the bucket's queue and is retried instead of being dropped
+    limiter = bucket(endpoint, credential)
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            return await make_call()
+        except RateLimited as e:
+            if attempt == RATE_LIMIT_RETRIES:
+                raise
+            limiter.pause(e.retry_after or RATE_LIMIT_DEFAULT_DELAY)
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import importlib
+
+import pytest
+
+# the bot modules live in the repo root, the web app runs from backend/ with
+# its own top-level `database` and `models`; both sides share one throwaway
+# SQLite database for the whole run
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ["SESSION_SECRET"] = "test"
+os.environ["ADMIN_EMAIL"] = "admin@example.com"
+
+sys.path.insert(0, ROOT_DIR)
+
+import db
+
+db.create_tables()
+
+BACKEND_MODULES = ("database", "models", "metrics", "migrations", "passwords", "auth", "page_cache", "main")
+_backend = {}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    # swaps the backend's modules into sys.modules for one test, so
+    # `import database` inside them doesn't pick up the bot's database.py
+    saved = {name: sys.modules.pop(name) for name in BACKEND_MODULES if name in sys.modules}
+    sys.modules.update(_backend)
+    sys.path.insert(0, BACKEND_DIR)
+    monkeypatch.chdir(BACKEND_DIR)
+
+    try:
+        yield importlib.import_module("main")
+    finally:
+        sys.path.remove(BACKEND_DIR)
+        for name in BACKEND_MODULES:
+            module = sys.modules.pop(name, None)
+            if module is not None:
+                _backend[name] = module
+        sys.modules.update(saved)
@@ -0,0 +1,78 @@
+import re
+import asyncio
+import importlib
+
+import httpx
+from sqlalchemy import text
+
+ADMIN = {"email": "admin@example.com", "password": "admin"}
+
+
+def seed(main, count):
+    passwords = importlib.import_module("passwords")
+    with main.engine.begin() as conn:
+        conn.execute(text("DELETE FROM users"))
+        conn.execute(
+            text("INSERT INTO users (email, password, api_token, tg_id) VALUES (:email, :password, :token, :tg)"),
+            [{"email": ADMIN["email"], "password": passwords.hash_password(ADMIN["password"]), "token": "admin", "tg": None}]
+            + [{"email": f"user{i}@example.com", "password": "-", "token": f"t{i}", "tg": i if i % 2 else None} for i in range(count)]
+        )
+        return [row[0] for row in conn.execute(text("SELECT id FROM users ORDER BY id"))]
+
+
+def page_ids(html):
+    return [int(i) for i in re.findall(r"/admin/reset-token/(\d+)", html)]
+
+
+def link(html, name):
+    found = re.search(rf"/admin\?[^\"]*{name}=(\d+)", html)
+    return int(found.group(1)) if found else None
+
+
+async def walk(main, **filters):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.post("/login", data=ADMIN)
+
+        forward, pages = [], []
+        after = 0
+        while True:
+            html = (await client.get("/admin", params={**filters, "after": after})).text
+            pages.append(page_ids(html))
+            forward += pages[-1]
+            after = link(html, "after")
+            if after is None:
+                break
+
+        backward = []
+        before = pages[-1][0]
+        while before:
+            html = (await client.get("/admin", params={**filters, "before": before})).text
+            backward = page_ids(html) + backward
+            before = link(html, "before")
+
+        return pages, forward, backward + pages[-1]
+
+
+def test_pages_cover_every_user_once(backend, monkeypatch):
+    monkeypatch.setattr(backend, "ADMIN_PAGE_SIZE", 4)
+    ids = seed(backend, 13)
+
+    pages, forward, backward = asyncio.run(walk(backend))
+
+    assert forward == ids
+    assert backward == ids
+    assert [len(page) for page in pages] == [4, 4, 4, 2]
+
+
+def test_pages_respect_filters(backend, monkeypatch):
+    monkeypatch.setattr(backend, "ADMIN_PAGE_SIZE", 3)
+    seed(backend, 13)
+
+    with backend.engine.connect() as conn:
+        linked = [row[0] for row in conn.execute(text("SELECT id FROM users WHERE tg_id IS NOT NULL ORDER BY id"))]
+
+    pages, forward, backward = asyncio.run(walk(backend, tg="yes"))
+
+    assert forward == linked
+    assert backward == linked
@@ -0,0 +1,69 @@
+import time
+import asyncio
+
+import ai_client
+
+
+def track(monkeypatch, delay):
+    # fake provider that records how many calls are in flight, overall and per user
+    stats = {"now": 0, "max": 0, "per_user": {}, "max_per_user": 0}
+
+    async def fake_chat(messages):
+        user = messages[-1]["content"].split(":")[0]
+        stats["now"] += 1
+        stats["per_user"][user] = stats["per_user"].get(user, 0) + 1
+        stats["max"] = max(stats["max"], stats["now"])
+        stats["max_per_user"] = max(stats["max_per_user"], stats["per_user"][user])
+
+        await asyncio.sleep(delay)
+
+        stats["now"] -= 1
+        stats["per_user"][user] -= 1
+        return {"choices": [{"message": {"content": messages[-1]["content"]}}]}
+
+    monkeypatch.setattr(ai_client, "AI_FAKE", True)
+    monkeypatch.setattr(ai_client, "_fake_chat", fake_chat)
+    return stats
+
+
+def test_fake_calls_are_bounded_by_global_slots(monkeypatch):
+    stats = track(monkeypatch, 0.05)
+
+    async def run():
+        monkeypatch.setattr(ai_client, "_global_slots", asyncio.Semaphore(4))
+        start = time.perf_counter()
+        await asyncio.gather(*(ai_client.chat(f"u{i}:hi", user_id=i) for i in range(12)))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+
+    assert stats["max"] == 4
+    # 12 calls through 4 slots: three rounds instead of twelve
+    assert elapsed < 12 * 0.05 / 2
+
+
+def test_one_user_cant_take_every_slot(monkeypatch):
+    stats = track(monkeypatch, 0.05)
+
+    async def run():
+        monkeypatch.setattr(ai_client, "_global_slots", asyncio.Semaphore(4))
+        done = {}
+
+        async def call(user, i):
+            await ai_client.chat(f"{user}:{i}", user_id=user, limit=2)
+            done[(user, i)] = time.perf_counter()
+
+        start = time.perf_counter()
+        heavy = [asyncio.create_task(call("heavy", i)) for i in range(10)]
+        await asyncio.sleep(0)
+        light = asyncio.create_task(call("light", 0))
+        await asyncio.gather(light, *heavy)
+        return start, done
+
+    start, done = asyncio.run(run())
+
+    assert stats["max_per_user"] == 2
+    # the light user isn't queued behind the heavy user's backlog
+    assert done[("light", 0)] - start < 2 * 0.05
+    assert done[("light", 0)] < max(t for (user, _), t in done.items() if user == "heavy")
+    assert not ai_client._user_slots
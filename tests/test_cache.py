@@ -0,0 +1,60 @@
+import asyncio
+
+import cache
+from db import SessionLocal
+from models import GenerationCache
+
+
+def setup_function():
+    db = SessionLocal()
+    db.query(GenerationCache).delete()
+    db.commit()
+    db.close()
+
+
+def keys():
+    db = SessionLocal()
+    found = {entry.key for entry in db.query(GenerationCache)}
+    db.close()
+    return found
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_MAX_ENTRIES", 3)
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.put(key, "chat", key.upper())
+        assert await cache.get("a") == "A"
+        await cache.put("d", "chat", "D")
+
+    asyncio.run(run())
+
+    # "a" was read after "b" was written, so "b" is the one to go
+    assert keys() == {"a", "c", "d"}
+
+
+def test_expired_entry_is_a_miss():
+    async def run():
+        await cache.put("old", "chat", "value", ttl=-1)
+        return await cache.get("old")
+
+    assert asyncio.run(run()) is None
+    assert "old" not in keys()
+
+
+def test_cached_calls_factory_once():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        return "generated"
+
+    async def run():
+        key = cache.make_key("chat", "model", "same   prompt")
+        first = await cache.cached(key, "chat", factory)
+        second = await cache.cached(cache.make_key("chat", "model", "same prompt"), "chat", factory)
+        return first, second
+
+    assert asyncio.run(run()) == ("generated", "generated")
+    assert len(calls) == 1
@@ -0,0 +1,49 @@
+import tempfile
+import importlib
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+
+def old_schema_engine():
+    engine = create_engine(f"sqlite:///{tempfile.mkdtemp()}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR, password VARCHAR, api_token VARCHAR, tg_id INTEGER)"
+        ))
+        conn.execute(text("""
+            INSERT INTO users (id, email, api_token, tg_id) VALUES
+                (1, 'a@x', 't1', 100),
+                (2, 'b@x', 't2', 100),
+                (3, 'c@x', 't3', 200),
+                (4, 'd@x', 't4', NULL),
+                (5, 'e@x', 't5', 100)
+        """))
+    return engine
+
+
+def test_duplicate_tg_ids_stay_on_the_oldest_user(backend):
+    migrations = importlib.import_module("migrations")
+    engine = old_schema_engine()
+
+    with engine.begin() as conn:
+        migrations.unique_user_lookups(conn)
+
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT id, tg_id FROM users ORDER BY id")).all())
+
+    assert rows == {1: 100, 2: None, 3: 200, 4: None, 5: None}
+
+
+def test_tg_id_and_token_are_unique_afterwards(backend):
+    migrations = importlib.import_module("migrations")
+    engine = old_schema_engine()
+
+    with engine.begin() as conn:
+        migrations.unique_user_lookups(conn)
+
+    for column, value in (("tg_id", 200), ("api_token", "t1")):
+        with pytest.raises(IntegrityError):
+            with engine.begin() as conn:
+                conn.execute(text(f"INSERT INTO users (email, {column}) VALUES ('new@x', :v)"), {"v": value})
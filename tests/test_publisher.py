@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import publisher
+from db import SessionLocal
+from models import PublishJob
+
+
+def setup_function():
+    db = SessionLocal()
+    db.query(PublishJob).delete()
+    db.commit()
+    db.close()
+
+
+def enqueue(platforms=("tg",), run_at=None):
+    publisher._enqueue(
+        list(platforms), 1, {p: f"https://img/{p}.jpg" for p in platforms}, "text",
+        run_at or datetime.utcnow() - timedelta(seconds=1)
+    )
+
+
+def job(job_id):
+    db = SessionLocal()
+    found = db.get(PublishJob, job_id)
+    db.close()
+    return found
+
+
+def test_claimed_job_is_leased():
+    enqueue()
+
+    first = publisher._claim(10)
+    second = publisher._claim(10)
+
+    assert len(first) == 1 and second == []
+    leased = job(first[0].id)
+    assert leased.status == "running"
+    assert leased.run_at > datetime.utcnow() + timedelta(seconds=publisher.PUBLISH_TIMEOUT * 2)
+
+
+def test_concurrent_claims_have_one_winner_per_job():
+    enqueue(["tg", "ig", "fb"] * 5)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        batches = list(pool.map(lambda _: publisher._claim(20), range(8)))
+
+    claimed = [j.id for batch in batches for j in batch]
+    assert len(claimed) == 15
+    assert len(set(claimed)) == 15
+
+
+def test_expired_lease_is_claimed_again():
+    enqueue()
+    job_id = publisher._claim(10)[0].id
+
+    db = SessionLocal()
+    db.get(PublishJob, job_id).run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    db.close()
+
+    assert [j.id for j in publisher._claim(10)] == [job_id]
+
+
+def test_future_jobs_wait():
+    enqueue(run_at=datetime.utcnow() + timedelta(hours=1))
+    assert publisher._claim(10) == []
+
+
+def test_failures_back_off_exponentially_then_give_up(monkeypatch):
+    monkeypatch.setitem(publisher.PUBLISH_BACKOFF, "tg", 10)
+    monkeypatch.setattr(publisher, "PUBLISH_MAX_ATTEMPTS", 3)
+    enqueue()
+    job_id = publisher._claim(10)[0].id
+
+    for attempt, delay in ((1, 10), (2, 20)):
+        before = datetime.utcnow()
+        assert publisher._finish(job_id, "boom") == "pending"
+
+        failed = job(job_id)
+        assert failed.attempts == attempt
+        assert failed.last_error == "boom"
+        assert (failed.run_at - before).total_seconds() == pytest.approx(delay, abs=1)
+
+    assert publisher._finish(job_id, "boom") == "failed"
+    assert job(job_id).attempts == 3
+    assert publisher._claim(10) == []
+
+
+def test_success_is_done():
+    enqueue()
+    job_id = publisher._claim(10)[0].id
+
+    assert publisher._finish(job_id) == "done"
+    assert job(job_id).status == "done"
+    assert job(job_id).last_error is None
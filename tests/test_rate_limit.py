@@ -0,0 +1,79 @@
+import time
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import TokenBucket, RateLimited
+
+
+def test_burst_then_steady_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, burst=3)
+        times = []
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+            times.append(time.monotonic() - start)
+        return times
+
+    times = asyncio.run(run())
+
+    # the burst goes out at once, then one token every 1/20 s
+    assert times[2] < 0.02
+    assert times[4] == pytest.approx(2 / 20, abs=0.03)
+
+
+def test_waiters_are_served_in_order():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=1)
+        order = []
+
+        async def take(i):
+            await bucket.acquire()
+            order.append(i)
+
+        await asyncio.gather(*(take(i) for i in range(6)))
+        return order
+
+    assert asyncio.run(run()) == list(range(6))
+
+
+def test_pause_holds_everyone_back():
+    async def run():
+        bucket = TokenBucket(rate=100, burst=10)
+        bucket.pause(0.1)
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_run_retries_after_rate_limit(monkeypatch):
+    monkeypatch.setitem(rate_limit.LIMITS, "test-retry", (100, 5))
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise RateLimited(0.05)
+        return "ok"
+
+    assert asyncio.run(rate_limit.run("test-retry", None, call)) == "ok"
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.04
+
+
+def test_run_gives_up_after_retries(monkeypatch):
+    monkeypatch.setitem(rate_limit.LIMITS, "test-give-up", (100, 5))
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_RETRIES", 2)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise RateLimited(0.01)
+
+    with pytest.raises(RateLimited):
+        asyncio.run(rate_limit.run("test-give-up", None, call))
+    assert len(attempts) == 3
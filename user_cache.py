@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+from db import SessionLocal
+from models import UserInvalidation
+
+
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_POLL = float(os.getenv("USER_CACHE_POLL", "2"))
+USER_CACHE_MAX = int(os.getenv("USER_CACHE_MAX", "10000"))
+
+# tg_id -> (expires, user); token -> (expires, user or None).
+# unknown tokens are cached too: tokens are random, so a miss stays a miss
+by_tg = {}
+by_token = {}
+
+_last_event = None
+_next_cleanup = 0
+
+
+# ================================
+# CACHE
+# ================================
+
+def get(cache, key):
+    entry = cache.get(key)
+    if entry is None:
+        return False, None
+
+    if entry[0] < time.monotonic():
+        cache.pop(key, None)
+        return False, None
+
+    return True, entry[1]
+
+def put(cache, key, user):
+    # dicts keep insertion order, so the first key is the oldest entry
+    cache.pop(key, None)
+    while len(cache) >= USER_CACHE_MAX:
+        cache.pop(next(iter(cache)), None)
+    cache[key] = (time.monotonic() + USER_CACHE_TTL, user)
+
+def sweep():
+    now = time.monotonic()
+    for cache in (by_tg, by_token):
+        for key, (expires, _) in list(cache.items()):
+            if expires < now:
+                cache.pop(key, None)
+
+def invalidate(user_id):
+    for cache in (by_tg, by_token):
+        for key, (_, user) in list(cache.items()):
+            if user is not None and user.id == user_id:
+                cache.pop(key, None)
+
+
+# ================================
+# CROSS-PROCESS INVALIDATION
+# ================================
+
+# the web admin writes a user_invalidations row for each user it changes;
+# every bot process polls the table and drops those users from its cache
+
+def notify(db, user_id):
+    db.add(UserInvalidation(user_id=user_id))
+
+def _poll():
+    global _last_event, _next_cleanup
+
+    db = SessionLocal()
+    query = db.query(UserInvalidation)
+
+    if _last_event is None:
+        last = query.order_by(UserInvalidation.id.desc()).first()
+        _last_event = last.id if last else 0
+        db.close()
+        return []
+
+    events = query.filter(UserInvalidation.id > _last_event).order_by(UserInvalidation.id).all()
+    if events:
+        _last_event = events[-1].id
+
+    if time.monotonic() > _next_cleanup:
+        db.query(UserInvalidation).filter(
+            UserInvalidation.created_at < datetime.utcnow() - timedelta(days=1)
+        ).delete()
+        db.commit()
+        _next_cleanup = time.monotonic() + 3600
+
+    db.close()
+
+    return [e.user_id for e in events]
+
+async def watch_invalidations():
+    while True:
+        for user_id in await asyncio.to_thread(_poll):
+            invalidate(user_id)
+        sweep()
+        await asyncio.sleep(USER_CACHE_POLL)
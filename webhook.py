@@ -0,0 +1,128 @@
+import os
+import asyncio
+import secrets
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+from aiogram import types
+
+from bot import bot, dp, expire_drafts, PUBLISHERS, notify_published
+from http_client import close_session
+from fsm_storage import SQLStorage
+from db import create_tables
+import publisher
+from backend import metrics
+import user_cache
+
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+log = logging.getLogger(__name__)
+
+# handlers trust msg.from_user.id, so an update without Telegram's secret
+# header could be forged as any linked user
+if not WEBHOOK_SECRET:
+    raise RuntimeError("WEBHOOK_SECRET is not set")
+
+
+# ================================
+# UPDATE QUEUE
+# ================================
+
+updates = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+workers = []
+
+
+async def worker():
+    while True:
+        update = await updates.get()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            log.exception("Update %s failed", update.update_id)
+        finally:
+            updates.task_done()
+
+
+async def start(set_webhook=True):
+    create_tables()
+
+    for _ in range(WEBHOOK_WORKERS):
+        workers.append(asyncio.create_task(worker()))
+
+    workers.append(asyncio.create_task(user_cache.watch_invalidations()))
+    workers.extend(publisher.start(PUBLISHERS, notify_published))
+
+    if isinstance(dp.storage, SQLStorage):
+        workers.append(asyncio.create_task(expire_drafts()))
+
+    if set_webhook and WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=100
+        )
+
+async def stop():
+    await updates.join()
+
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    workers.clear()
+
+    await close_session()
+    await bot.session.close()
+
+
+# ================================
+# ASGI APP
+# ================================
+
+# when mounted on another app (app.mount("/tg", webhook_app)) the host has to
+# call start()/stop() itself: Starlette doesn't run lifespans of mounted apps
+
+@asynccontextmanager
+async def lifespan(app):
+    await start()
+    yield
+    await stop()
+
+webhook_app = FastAPI(lifespan=lifespan)
+
+
+@webhook_app.post(WEBHOOK_PATH)
+async def receive_update(request: Request):
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not secrets.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+        return Response(status_code=401)
+
+    update = types.Update.model_validate(await request.json(), context={"bot": bot})
+
+    # a full queue answers 503 so Telegram retries later instead of us
+    # accepting more work than the workers can drain
+    try:
+        updates.put_nowait(update)
+    except asyncio.QueueFull:
+        return Response(status_code=503)
+
+    return Response(status_code=200)
+
+
+@webhook_app.get("/metrics")
+async def bot_metrics():
+    return PlainTextResponse(metrics.render())
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(webhook_app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)